@@ -0,0 +1,125 @@
+# /usr/bin/env python
+# coding=utf-8
+from __future__ import print_function
+
+import os.path
+from argparse import ArgumentParser
+from functools import partial
+
+try:
+    from . import run
+    from .convert import unescape
+    from .gamelog import open_log, read_log
+except ImportError:  # run as a script
+    import run
+    from convert import unescape
+    from gamelog import open_log, read_log
+
+BASE_PATH = partial(os.path.join, os.path.abspath(os.path.dirname(__file__)))
+
+# DEFAULTS
+TARGET = BASE_PATH('main.py')
+BOOK = BASE_PATH('book.bin')
+SOURCES = [BASE_PATH('allmoves.json')]
+
+
+class Recorder(object):
+    """Play through a bot's Session, searching every turn and adding each searched move to a book"""
+
+    def __init__(self, bot, master, book):
+        # an empty book, so every move is searched
+        self.session = bot.Session(master, book=bot.OpeningBook(book.master))
+        self.book = book
+
+    def search(self, stdin):
+        self.session.observe(stdin)
+        move = self.session.search()
+        self.book.add(self.session.board, move)
+        return move
+
+    def next_move(self, stdin):
+        return self.session.play(self.search(stdin)), ''
+
+
+def simulate(bot, master, book, max_moves=run.MAX_MOVES):
+    """Play from every open cell and facing of the master"""
+
+    rows = master.split('\n')
+
+    for y, row in enumerate(rows):
+        for x, char in enumerate(row):
+            if char != '-':
+                continue
+
+            for facing in ('UP', 'RIGHT', 'DOWN', 'LEFT'):
+                board = run.Board(master[:y * (len(row) + 1) + x] + 'b' + master[y * (len(row) + 1) + x + 1:], facing)
+                run.play(board, Recorder(bot, master, book).next_move, max_moves)
+
+
+def replay(bot, master, book, source):
+    """Follow each player of each recorded game, as long as its moves stay on the master"""
+
+    games = 0
+
+    with open_log(source) as f:
+        for game in read_log(f):
+            game = unescape(game)
+            players = {}
+
+            for stdin, stdout in zip(game['inputs']['payload'], game['outputs']['payload']):
+                player = stdin.split('\n', 1)[0]
+                recorder = players.setdefault(player, Recorder(bot, master, book))
+                if recorder is None:
+                    continue
+
+                try:
+                    recorder.search(stdin)
+                    recorder.session.play(stdout.strip())
+                except Exception:
+                    # recorded on another maze, or a move the bot cannot follow
+                    players[player] = None
+
+            games += 1
+
+    return games
+
+
+def create_parser():
+    """Create an argument parser"""
+
+    parser = ArgumentParser(description='Build an opening book of searched moves for maze escape.')
+    parser.add_argument('sources', nargs='*', default=SOURCES,
+                        help='Recorded games to follow, optionally .gz or .zst (%s)' % os.path.basename(SOURCES[0]))
+    parser.add_argument('-f', '--file', default=TARGET, dest='target',
+                        help='Bot to search with (%s)' % os.path.basename(TARGET))
+    parser.add_argument('-M', '--master', type=open,
+                        help="Master map file, the bot's MASTER by default")
+    parser.add_argument('-o', '--out', default=BOOK, dest='book',
+                        help='Book file to write (%s)' % os.path.basename(BOOK))
+    parser.add_argument('-m', '--max', default=run.MAX_MOVES, type=int, dest='max_moves',
+                        help='Max number of moves per simulated game (%d)' % run.MAX_MOVES)
+
+    return parser.parse_args()
+
+
+def main():
+    args = create_parser()
+
+    with run.temp_dir():
+        bot = run.load_bot(args.target)
+        master = args.master.read().strip() if args.master else bot.MASTER
+        book = bot.OpeningBook(bot.Board.from_str(master))
+
+        simulate(bot, master, book, args.max_moves)
+        print('simulated: %d positions' % len(book))
+
+        for source in args.sources:
+            games = replay(bot, master, book, source)
+            print('%s: %d games, %d positions' % (source, games, len(book)))
+
+    with open(args.book, 'wb') as f:
+        book.dump(f)
+
+
+if __name__ == '__main__':
+    main()
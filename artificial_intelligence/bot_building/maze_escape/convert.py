@@ -1,20 +1,60 @@
 # coding=utf-8
 import json
-import os
+import os.path
+from argparse import ArgumentParser
+
+try:
+    from .gamelog import open_log, read_log, write_log
+except ImportError:  # run as a script
+    from gamelog import open_log, read_log, write_log
 
 TARGET = 'allmoves.json'
-DUMP = 'allmoves-fixed.json'
+DUMP = 'allmoves-fixed.jsonl'
 BASE_PATH = os.path.abspath(os.path.dirname(__file__))
 
-with open(os.path.join(BASE_PATH, TARGET)) as f:
-    games = json.load(f)
 
-for i, game in enumerate(games):
+def unescape(game):
+    """Decode values recorded as nested JSON strings"""
+
     for key, value in game.items():
         try:
             game[key] = json.loads(value)
         except (json.JSONDecodeError, TypeError):
             pass
 
-with open(os.path.join(BASE_PATH, DUMP), 'w') as f:
-    json.dump(games, f, sort_keys=True, indent=2)
+    return game
+
+
+def convert(source, dump):
+    """Unescape each recorded game of source into the log dump, one game at a time"""
+
+    count = 0
+
+    with open_log(source) as games, open_log(dump, 'w') as log:
+        for game in read_log(games):
+            write_log(log, unescape(game))
+            count += 1
+
+    return count
+
+
+def create_parser():
+    """Create an argument parser"""
+
+    parser = ArgumentParser(description='Unescape recorded maze escape games into a JSON lines log.')
+    parser.add_argument('source', nargs='?', default=os.path.join(BASE_PATH, TARGET),
+                        help='Recorded games, a JSON array or JSON lines, optionally .gz or .zst (%s)' % TARGET)
+    parser.add_argument('dump', nargs='?', default=os.path.join(BASE_PATH, DUMP),
+                        help='Log to write, compressed by a .gz or .zst extension (%s)' % DUMP)
+
+    return parser.parse_args()
+
+
+def main():
+    args = create_parser()
+
+    print('%s: %d games' % (args.dump, convert(args.source, args.dump)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# /usr/bin/env python
+# coding=utf-8
+from __future__ import print_function
+
+import os.path
+import sqlite3
+from argparse import ArgumentParser
+from contextlib import closing
+from functools import partial
+
+try:
+    from .convert import unescape
+    from .gamelog import open_log, read_log
+except ImportError:  # run as a script
+    from convert import unescape
+    from gamelog import open_log, read_log
+
+BASE_PATH = partial(os.path.join, os.path.abspath(os.path.dirname(__file__)))
+
+# DEFAULTS
+DATABASE = BASE_PATH('games.db')
+SOURCES = [BASE_PATH('allmoves.json')]
+LIMIT = 20
+
+# move outcomes, by the cell a move steps onto
+ESCAPED = 'escaped'
+CRASHED = 'crashed'
+MOVED = 'moved'
+INVALID = 'invalid'
+
+# cell in the 3x3 view each move steps onto
+TARGETS = {'UP': 1, 'RIGHT': 5, 'DOWN': 7, 'LEFT': 3}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game INTEGER PRIMARY KEY,
+    id INTEGER UNIQUE,
+    source TEXT NOT NULL,
+    player1 TEXT,
+    player2 TEXT,
+    moves INTEGER NOT NULL,
+    winner INTEGER
+);
+CREATE TABLE IF NOT EXISTS moves (
+    game INTEGER NOT NULL REFERENCES games (game),
+    move INTEGER NOT NULL,
+    player INTEGER NOT NULL,
+    view TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (game, move)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS games_source ON games (source);
+CREATE INDEX IF NOT EXISTS moves_view ON moves (view, direction);
+CREATE INDEX IF NOT EXISTS moves_outcome ON moves (outcome, game);
+"""
+
+
+def outcome(view, direction):
+    """What a move does from a view"""
+
+    if direction not in TARGETS:
+        return INVALID
+
+    cell = view.replace('\n', '')[TARGETS[direction]]
+    return {'e': ESCAPED, '#': CRASHED}.get(cell, MOVED)
+
+
+def split_input(stdin):
+    """Player number and view from a move's input"""
+
+    player, _, view = stdin.strip().partition('\n')
+    return int(player), view
+
+
+def recorded_game(game):
+    """Game details and moves from a recorded game, as in allmoves.json"""
+
+    game = unescape(game)
+    moves = []
+
+    for index, (stdin, stdout) in enumerate(zip(game['inputs']['payload'], game['outputs']['payload'])):
+        player, view = split_input(stdin)
+        direction = stdout.strip()
+        moves.append((index, player, view, direction, outcome(view, direction)))
+
+    details = game['id'], game.get('player-1'), game.get('player-2')
+    return details, moves
+
+
+def logged_games(records):
+    """Game details and moves from a run.py log, one game per outcome record"""
+
+    moves = []
+
+    for record in records:
+        if 'outcome' in record:
+            yield (None, None, None), moves
+            moves = []
+            continue
+
+        player, view = split_input(record['stdin'])
+        direction = record['stdout'].strip()
+        moves.append((record['move'], player, view, direction, outcome(view, direction)))
+
+    if moves:
+        yield (None, None, None), moves
+
+
+def connect(path=DATABASE):
+    """Open the database, creating its tables"""
+
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def ingest(db, source):
+    """Add every game in a recorded archive or run.py log, streaming it, replacing what it added before"""
+
+    count = 0
+    path = os.path.abspath(source)
+
+    with open_log(source) as f:
+        records = read_log(f)
+        first = next(records, None)
+        if first is None:
+            return count
+
+        records = chain_first(first, records)
+        games = (recorded_game(game) for game in records) if 'inputs' in first else logged_games(records)
+
+        # logged games have no id to replace them by, drop those the log added last time
+        db.execute('DELETE FROM moves WHERE game IN (SELECT game FROM games WHERE source = ? AND id IS NULL)', (path,))
+        db.execute('DELETE FROM games WHERE source = ? AND id IS NULL', (path,))
+
+        for (game_id, player1, player2), moves in games:
+            winner = next((player for _, player, _, _, result in moves if result == ESCAPED), None)
+
+            # re-ingesting a recorded game replaces it
+            if game_id is not None:
+                db.execute('DELETE FROM moves WHERE game IN (SELECT game FROM games WHERE id = ?)', (game_id,))
+                db.execute('DELETE FROM games WHERE id = ?', (game_id,))
+
+            cursor = db.execute('INSERT INTO games (id, source, player1, player2, moves, winner) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (game_id, path, player1, player2, len(moves), winner))
+            db.executemany('INSERT INTO moves (game, move, player, view, direction, outcome) '
+                           'VALUES (?, ?, ?, ?, ?, ?)',
+                           ((cursor.lastrowid,) + move for move in moves))
+            count += 1
+
+    db.commit()
+    return count
+
+
+def chain_first(first, rest):
+    yield first
+    yield from rest
+
+
+def find_game(db, game_id):
+    """Moves of a game by its recorded id"""
+
+    return db.execute('SELECT moves.move, moves.player, moves.view, moves.direction, moves.outcome '
+                      'FROM games JOIN moves ON moves.game = games.game '
+                      'WHERE games.id = ? ORDER BY moves.move', (game_id,))
+
+
+def view_stats(db, pattern):
+    """Moves made from views matching a glob pattern, '?' for any cell, counted by direction and outcome"""
+
+    return db.execute('SELECT direction, outcome, COUNT(*) FROM moves WHERE view GLOB ? '
+                      'GROUP BY direction, outcome ORDER BY COUNT(*) DESC', (pattern,))
+
+
+def find_outcome(db, result, limit=LIMIT):
+    """Moves with an outcome, newest games first"""
+
+    return db.execute('SELECT games.id, moves.move, moves.player, moves.view, moves.direction '
+                      'FROM moves JOIN games ON games.game = moves.game '
+                      'WHERE moves.outcome = ? ORDER BY moves.game DESC, moves.move LIMIT ?', (result, limit))
+
+
+def show_view(view):
+    return view.replace('\n', '/')
+
+
+def create_parser():
+    """Create an argument parser"""
+
+    parser = ArgumentParser(description='Index and query recorded maze escape games.')
+    parser.add_argument('-d', '--database', default=DATABASE,
+                        help='SQLite database (%s)' % os.path.basename(DATABASE))
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    build = commands.add_parser('build', help='Add recorded archives or run.py logs')
+    build.add_argument('sources', nargs='*', default=SOURCES,
+                       help='Archives or logs, optionally .gz or .zst (%s)' % os.path.basename(SOURCES[0]))
+
+    game = commands.add_parser('game', help='Moves of a game, by id')
+    game.add_argument('id', type=int)
+
+    view = commands.add_parser('view', help="Move statistics for a view, rows split by '/' and '?' for any cell")
+    view.add_argument('pattern')
+
+    result = commands.add_parser('outcome', help='Moves with an outcome')
+    result.add_argument('outcome', choices=(ESCAPED, CRASHED, MOVED, INVALID))
+    result.add_argument('-n', '--limit', default=LIMIT, type=int,
+                        help='Max number of moves (%d)' % LIMIT)
+
+    return parser.parse_args()
+
+
+def main():
+    args = create_parser()
+
+    with closing(connect(args.database)) as db:
+        if args.command == 'build':
+            for source in args.sources:
+                print('%s: %d games' % (source, ingest(db, source)))
+
+        if args.command == 'game':
+            for move, player, view, direction, result in find_game(db, args.id):
+                print('%3d  %d  %s  %-5s  %s' % (move, player, show_view(view), direction, result))
+
+        if args.command == 'view':
+            for direction, result, count in view_stats(db, args.pattern.replace('/', '\n')):
+                print('%-5s  %-7s  %d' % (direction, result, count))
+
+        if args.command == 'outcome':
+            for game_id, move, player, view, direction in find_outcome(db, args.outcome, args.limit):
+                print('%s  %3d  %d  %s  %s' % (game_id, move, player, show_view(view), direction))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# coding=utf-8
+import gzip
+import io
+import json
+import re
+from itertools import chain, islice
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .zst logs
+    zstandard = None
+
+ENCODING = 'utf-8'
+CHUNK_SIZE = 1 << 16
+WHITESPACE = re.compile(r'\s*')
+
+
+def open_log(path, mode='r'):
+    """Open a game log as text, gzip or zstd compressed by its extension"""
+
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding=ENCODING)
+
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError('Install zstandard to read or write %s' % path)
+        return zstandard.open(path, mode + 't', encoding=ENCODING)
+
+    return io.open(path, mode, encoding=ENCODING)
+
+
+def write_log(f, record):
+    """Append one record as a line of JSON"""
+
+    f.write(json.dumps(record, sort_keys=True))
+    f.write('\n')
+
+    # plain logs can be followed while the game runs, compressed ones flush on close
+    if isinstance(getattr(f, 'buffer', None), io.BufferedWriter):
+        f.flush()
+
+
+def read_log(f, start=0):
+    """Stream records from a JSON lines log, or from an old style JSON array, skipping the first start"""
+
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+
+    if first == '[':
+        return islice(iter_array(f), start, None)
+
+    # skipped lines are never decoded
+    lines = islice(chain([first + f.readline()], f), start, None)
+    return (json.loads(line) for line in lines if line.strip())
+
+
+def iter_array(f):
+    """Decode a JSON array one element at a time, after its opening bracket"""
+
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+
+    while True:
+        # skip separators, refilling the buffer as it runs out
+        while True:
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','):
+                position += 1
+            if position < len(buffer):
+                break
+
+            buffer, position = f.read(CHUNK_SIZE), 0
+            if not buffer:
+                return
+
+        if buffer[position] == ']':
+            return
+
+        chunk = None
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                raise
+        else:
+            # a value not followed by a separator may go on in the next chunk, as a cut off number does
+            after = WHITESPACE.match(buffer, end).end()
+            if after == len(buffer) or buffer[after] not in ',]':
+                chunk = f.read(CHUNK_SIZE)
+
+        if chunk:
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        yield record
+        position = end
@@ -0,0 +1,265 @@
+# /usr/bin/env python
+# coding=utf-8
+from __future__ import print_function
+
+import os.path
+import random
+from argparse import ArgumentParser
+from collections import deque
+
+# DEFAULTS
+ALGORITHM = 'backtracker'
+SIZE = '7x7'
+SEED = 0
+COUNT = 1
+
+MIN_SIZE = 5
+MAX_SIZE = 2000
+
+WALL = ord('#')
+OPEN = ord('-')
+EXIT = ord('e')
+BOT = ord('b')
+
+
+class Grid(object):
+    """Flat wall filled grid, carved into a maze"""
+
+    def __init__(self, height, width, rng):
+        if not MIN_SIZE <= height <= MAX_SIZE or not MIN_SIZE <= width <= MAX_SIZE:
+            raise ValueError('Size must be between %dx%d and %dx%d' % (MIN_SIZE, MIN_SIZE, MAX_SIZE, MAX_SIZE))
+
+        self.height = height
+        self.width = width
+        self.rng = rng
+        self.cells = bytearray([WALL]) * (height * width)
+
+    def __str__(self):
+        width = self.width
+        return '\n'.join(self.cells[start:start + width].decode('ascii')
+                         for start in range(0, len(self.cells), width))
+
+    def carve(self, y, x):
+        self.cells[y * self.width + x] = OPEN
+
+    def carve_line(self, start, end):
+        """Carve an L shaped corridor, vertical then horizontal"""
+
+        (y1, x1), (y2, x2) = start, end
+
+        for y in range(min(y1, y2), max(y1, y2) + 1):
+            self.carve(y, x1)
+        for x in range(min(x1, x2), max(x1, x2) + 1):
+            self.carve(y2, x)
+
+    def lattice(self):
+        """Interior cells at odd coordinates, one bytes flag per cell"""
+
+        height, width = self.height, self.width
+        flags = bytearray(height * width)
+
+        for y in range(1, height - 1, 2):
+            flags[y * width + 1:(y + 1) * width - 1:2] = b'\x01' * len(range(1, width - 1, 2))
+
+        return flags
+
+    def place_exit(self):
+        """Open an exit on a random border cell, tunnelling to the nearest open cell"""
+
+        height, width, cells, rng = self.height, self.width, self.cells, self.rng
+
+        side = rng.randrange(4)
+        if side in (0, 2):
+            x = rng.randrange(1, width - 1)
+            y, inner = (0, width) if side == 0 else (height - 1, -width)
+        else:
+            y = rng.randrange(1, height - 1)
+            x, inner = (0, 1) if side == 3 else (width - 1, -1)
+
+        exit_index = y * width + x
+        cells[exit_index] = EXIT
+
+        # breadth first through the interior, back from the nearest open cell
+        parents = {exit_index + inner: exit_index}
+        queue = deque([exit_index + inner])
+        while queue:
+            index = queue.popleft()
+            if cells[index] == OPEN:
+                break
+
+            for step in (-width, 1, width, -1):
+                neighbour = index + step
+                row, column = divmod(neighbour, width)
+                if 0 < row < height - 1 and 0 < column < width - 1 and neighbour not in parents:
+                    parents[neighbour] = index
+                    queue.append(neighbour)
+
+        while index != exit_index:
+            cells[index] = OPEN
+            index = parents[index]
+
+    def place_bot(self):
+        """Put the bot on a random open cell"""
+
+        cells = [index for index, cell in enumerate(self.cells) if cell == OPEN]
+        self.cells[self.rng.choice(cells)] = BOT
+
+
+def backtracker(grid):
+    """Depth first recursive backtracker, long winding corridors"""
+
+    width, cells, rng = grid.width, grid.cells, grid.rng
+    unvisited = grid.lattice()
+    size = len(cells)
+    steps = (-2 * width, 2, 2 * width, -2)
+
+    start = rng.choice([index for index, flag in enumerate(unvisited) if flag])
+    unvisited[start] = 0
+    cells[start] = OPEN
+    stack = [start]
+
+    while stack:
+        index = stack[-1]
+        neighbours = [index + step for step in steps if 0 <= index + step < size and unvisited[index + step]]
+
+        if not neighbours:
+            stack.pop()
+            continue
+
+        neighbour = rng.choice(neighbours)
+        unvisited[neighbour] = 0
+        cells[(index + neighbour) // 2] = OPEN
+        cells[neighbour] = OPEN
+        stack.append(neighbour)
+
+
+def prim(grid):
+    """Randomized Prim's algorithm, short branching dead ends"""
+
+    width, cells, rng = grid.width, grid.cells, grid.rng
+    unvisited = grid.lattice()
+    size = len(cells)
+    steps = (-2 * width, 2, 2 * width, -2)
+
+    start = rng.choice([index for index, flag in enumerate(unvisited) if flag])
+    frontier = [start]
+    unvisited[start] = 0
+
+    while frontier:
+        # swap remove a random frontier cell
+        position = rng.randrange(len(frontier))
+        frontier[position], frontier[-1] = frontier[-1], frontier[position]
+        index = frontier.pop()
+
+        visited = [index + step for step in steps if 0 <= index + step < size and cells[index + step] == OPEN]
+        if visited:
+            cells[(index + rng.choice(visited)) // 2] = OPEN
+        cells[index] = OPEN
+
+        for step in steps:
+            neighbour = index + step
+            if 0 <= neighbour < size and unvisited[neighbour]:
+                unvisited[neighbour] = 0
+                frontier.append(neighbour)
+
+
+def rooms(grid):
+    """Rectangular rooms chained together by corridors"""
+
+    height, width, rng = grid.height, grid.width, grid.rng
+    largest = max(min(height, width) // 10, 3)
+    placed = []
+
+    for _ in range(height * width // 400 + 16):
+        room_height, room_width = rng.randint(2, min(largest, height - 2)), rng.randint(2, min(largest, width - 2))
+        top, left = rng.randint(1, height - 1 - room_height), rng.randint(1, width - 1 - room_width)
+        bottom, right = top + room_height, left + room_width
+
+        # keep a wall between rooms
+        if any(top <= other_bottom and other_top <= bottom and left <= other_right and other_left <= right
+               for other_top, other_left, other_bottom, other_right in placed):
+            continue
+
+        placed.append((top, left, bottom, right))
+        for y in range(top, bottom):
+            grid.cells[y * width + left:y * width + right] = bytes([OPEN]) * room_width
+
+    centers = [((top + bottom - 1) // 2, (left + right - 1) // 2) for top, left, bottom, right in placed]
+    for start, end in zip(centers, centers[1:]):
+        grid.carve_line(start, end)
+
+
+ALGORITHMS = {
+    'backtracker': backtracker,
+    'prim': prim,
+    'rooms': rooms,
+}
+
+
+def generate(height, width, algorithm=ALGORITHM, seed=SEED, bot=False):
+    """Generate a maze as a run.Board string, every open cell reachable from 'e'
+
+    :param int height: Rows, between MIN_SIZE and MAX_SIZE
+    :param int width: Columns, between MIN_SIZE and MAX_SIZE
+    :param str algorithm: Key in ALGORITHMS
+    :param int seed: Seed, the same arguments always give the same maze
+    :param bool bot: Put a 'b' on a random open cell
+    :rtype: str
+    """
+
+    grid = Grid(height, width, random.Random(seed))
+    ALGORITHMS[algorithm](grid)
+    grid.place_exit()
+
+    if bot:
+        grid.place_bot()
+
+    return str(grid)
+
+
+def parse_size(value):
+    """Parse HEIGHTxWIDTH"""
+
+    height, _, width = value.lower().partition('x')
+    return int(height), int(width or height)
+
+
+def create_parser():
+    """Create an argument parser"""
+
+    parser = ArgumentParser(description='Generate maze escape mazes.')
+    parser.add_argument('-a', '--algorithm', default=ALGORITHM, choices=sorted(ALGORITHMS),
+                        help='Maze algorithm (%s)' % ALGORITHM)
+    parser.add_argument('-s', '--size', default=SIZE, type=parse_size,
+                        help='Maze size as HEIGHTxWIDTH (%s)' % SIZE)
+    parser.add_argument('--seed', default=SEED, type=int,
+                        help='Seed of the first maze (%d)' % SEED)
+    parser.add_argument('-n', '--count', default=COUNT, type=int,
+                        help='Number of mazes, with consecutive seeds (%d)' % COUNT)
+    parser.add_argument('-b', '--bot', action='store_true',
+                        help="Place the bot 'b' on a random open cell")
+    parser.add_argument('-o', '--out', dest='directory',
+                        help='Directory to write maze files to, otherwise print them')
+
+    return parser.parse_args()
+
+
+def main():
+    args = create_parser()
+    height, width = args.size
+
+    for seed in range(args.seed, args.seed + args.count):
+        maze = generate(height, width, args.algorithm, seed, args.bot)
+
+        if not args.directory:
+            print(maze, end='\n\n')
+            continue
+
+        os.makedirs(args.directory, exist_ok=True)
+        filename = '%s-%dx%d-%d.txt' % (args.algorithm, height, width, seed)
+        with open(os.path.join(args.directory, filename), 'w') as f:
+            f.write(maze + '\n')
+
+
+if __name__ == '__main__':
+    main()
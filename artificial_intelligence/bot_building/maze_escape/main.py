@@ -1,19 +1,48 @@
 # coding=utf-8
+import hashlib
+import json
+import mmap
 import os
-import re
+import struct
 import sys
-from collections import defaultdict
-from copy import deepcopy
-from functools import partial
+import traceback
+import zlib
+from array import array
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from heapq import heappop, heappush
 from itertools import chain
 from operator import eq, itemgetter, contains
+from tempfile import TemporaryDirectory
 from textwrap import dedent
+from time import perf_counter
 
 RAISE = 'RAISE'
+ENCODING = 'latin-1'
+LABEL = 0
+UNKNOWN = ord('o')
+WALL = ord('#')
+INDEX_LIMIT = 32
+VIEW_CACHE_SIZE = 4096
+UNREACHABLE = 0xFFFFFFFF
+MAX_SESSIONS = 64
+BOOK = 'book.bin'
+PARALLEL_BATCH = 256
+PRECOMPUTE_BATCH = 64
 
 
 class Board(object):
-    _state = NotImplemented
+    def __init__(self):
+        self._grid = bytearray()
+        self._diff = None
+        self.height = 0
+        self.width = 0
+        self.labels = {}
+        self.index = {}
+        self._unindexed = set()
+        self._dimensions = None
 
     @classmethod
     def from_str(cls, state):
@@ -25,7 +54,12 @@ class Board(object):
     @classmethod
     def from_state(cls, state):
         self = cls()
-        self._state = state
+        self.height = len(state)
+        self.width = len(state[0]) if state else 0
+        self.grid = bytearray(self.height * self.width)
+
+        for index, cell in enumerate(chain.from_iterable(state)):
+            self._put(index, cell.value if hasattr(cell, 'value') else cell)
         return self
 
     @classmethod
@@ -62,45 +96,75 @@ class Board(object):
 
     @property
     def state(self):
-        return self._state
+        """
+        :return: Cells as rows, built from the flat grid
+        :rtype: [[Cell]]
+        """
+        width = self.width
+        return [[self._cell(y * width + x) for x in range(width)] for y in range(self.height)]
 
     @state.setter
     def state(self, value):
         """
         :param str value:
         """
-        self._state = [[Cell(y, x, char) for x, char in enumerate(row)]
-                       for y, row in enumerate(value.split('\n')) if row]
+        rows = [row for row in value.split('\n') if row]
+
+        self.height = len(rows)
+        self.width = len(rows[0]) if rows else 0
+        self.grid = bytearray(''.join(rows), ENCODING)
+        self.labels = {}
+        self.index = {}
+        self._unindexed = set()
+
+    @property
+    def grid(self):
+        """
+        :return: Flat grid, folding any copy-on-write changes into a buffer of its own first
+        :rtype: bytearray
+        """
+        if self._diff is not None:
+            self._fold()
+        return self._grid
+
+    @grid.setter
+    def grid(self, value):
+        self._grid, self._diff = value, None
 
     @property
     def dimensions(self):
-        state = self.state
-        return Dimensions(y=len(state), x=len(state[0]))
+        # shared between calls until the board grows, treat as read only
+        dimensions = self._dimensions
+        if dimensions is None or dimensions.y != self.height or dimensions.x != self.width:
+            dimensions = self._dimensions = Dimensions(y=self.height, x=self.width)
+        return dimensions
 
     def __iter__(self):
-        return (cell for row in self.state for cell in row)
+        return (self._cell(index) for index in range(self.height * self.width))
 
     def iter_box(self, coord, dimensions):
-        _min = coord
-        _max = Coord(dimensions.y + coord.y, dimensions.x + coord.x)
-        for y, row in enumerate(self.state):
-            if y < _min.y or y >= _max.y:
-                continue
+        width = self.width
+        x_min, x_max = max(coord.x, 0), min(coord.x + dimensions.x, width)
+        y_min, y_max = max(coord.y, 0), min(coord.y + dimensions.y, self.height)
 
-            for x, cell in enumerate(row):
-                if x < _min.x or x >= _max.x:
-                    continue
-                yield cell
+        for y in range(y_min, y_max):
+            for x in range(x_min, x_max):
+                yield self._cell(y * width + x)
 
     def view(self, coord):
-        state = self.state
-        cells = [
-            [state[coord.y - 1][coord.x - 1], state[coord.y - 1][coord.x + 0], state[coord.y - 1][coord.x + 1]],
-            [state[coord.y + 0][coord.x - 1], state[coord.y + 0][coord.x + 0], state[coord.y + 0][coord.x + 1]],
-            [state[coord.y + 1][coord.x - 1], state[coord.y + 1][coord.x + 0], state[coord.y + 1][coord.x + 1]],
-        ]
+        """
+        :param Coord coord:
+        :return: 3x3 cells around coord, 'o' past the board's edges
+        :rtype: str
+        """
+        if 0 < coord.y < self.height - 1 and 0 < coord.x < self.width - 1:
+            start = (coord.y - 1) * self.width + coord.x - 1
+            rows = (start + self.width * y for y in range(3))
+            return '\n'.join(self._row_str(row, row + 3) for row in rows)
 
-        return '\n'.join(''.join(cell.value for cell in row) for row in cells)
+        return '\n'.join(''.join(self._value(y * self.width + x) if self.is_valid(Coord(y, x)) else 'o'
+                                  for x in range(coord.x - 1, coord.x + 2))
+                          for y in range(coord.y - 1, coord.y + 2))
 
     def find(self, target, default=RAISE):
         """
@@ -114,11 +178,11 @@ class Board(object):
             raise InvalidTarget('Target is not valid')
 
         if isinstance(target, Coord):
-            return self.state[target.y][target.x]
+            return self._cell(target.y * self.width + target.x)
 
-        for cell in self:
-            if cell.value == target:
-                return cell
+        index = self._locate(target)
+        if index is not None:
+            return self._cell(index)
 
         if default is not RAISE:
             return default
@@ -132,6 +196,15 @@ class Board(object):
         :param str value:
         :param cmp:
         """
+        if cmp is eq and len(value) == 1:
+            indexes = self.index.get(ord(value))
+            indexes = sorted(indexes) if indexes is not None else self._positions(value)
+            return (self._cell(index) for index in indexes)
+
+        if cmp is contains and not self.labels:
+            indexes = sorted(chain.from_iterable(self._positions(char) for char in set(value)))
+            return (self._cell(index) for index in indexes)
+
         return (cell for cell in self if cmp(value, cell.value))
 
     def set(self, target, value):
@@ -145,8 +218,7 @@ class Board(object):
         if not self.is_valid(target):
             raise InvalidTarget('Target is not valid')
 
-        target_cell = self.find(target)
-        target_cell.value = value
+        self._put(target.y * self.width + target.x, value)
 
     def is_valid(self, target):
         """
@@ -157,22 +229,33 @@ class Board(object):
         if not isinstance(target, Coord):
             return False
 
-        if target.x < 0 or target.x >= self.dimensions.x:
+        if target.x < 0 or target.x >= self.width:
             return False
-        if target.y < 0 or target.y >= self.dimensions.y:
+        if target.y < 0 or target.y >= self.height:
             return False
 
         return True
 
     def fork(self):
         """
-        :return: A selectively deep copy board copy
+        Copy-on-write copy, both boards share the grid and record their own changes until they grow large.
+
+        :return: A board copy
         :rtype: Board
         """
+        if self._diff is None:
+            self._diff = {}
+        STATS.count('boards_forked')
+
         # noinspection PyPep8Naming
         BoardClass = self.__class__
-        state = deepcopy(self.state)
-        return BoardClass.from_state(state)
+        board = BoardClass()
+        board._grid, board._diff = self._grid, dict(self._diff)
+        board.height, board.width = self.height, self.width
+        board.labels = dict(self.labels)
+        board.index = {code: set(indexes) for code, indexes in self.index.items()}
+        board._unindexed = set(self._unindexed)
+        return board
 
     def move(self, start, end, trail='-'):
         """
@@ -185,113 +268,209 @@ class Board(object):
         start_cell = self.find(start)
         end_cell = self.find(end.resolve(start_cell) if isinstance(end, Delta) else end)
 
-        if end_cell.value is '#':
+        if end_cell.value == '#':
             raise InvalidTarget('Cannot move into #')
 
         self.set(end_cell, start_cell.value)
         self.set(start_cell, trail)
 
     def __str__(self):
-        return '\n'.join(''.join(cell.value if hasattr(cell, 'value') else cell for cell in row) for row in self.state)
+        width = self.width
+        if self.labels:
+            return '\n'.join(self._row_str(y * width, (y + 1) * width) for y in range(self.height))
+
+        # fold a fork's changes first, decoding per cell is far slower than one copy of the grid
+        text = self.grid.decode(ENCODING)
+        return '\n'.join(text[y * width:(y + 1) * width] for y in range(self.height))
 
     def merge(self, other, target='b'):
         self_target = self.find(target)
         other_target = other.find(target)
 
-        self_padding = {
-            'UP': self_target.y,
-            'DOWN': self.dimensions.y - self_target.y,
-            'LEFT': self_target.x,
-            'RIGHT': self.dimensions.x - self_target.x,
-        }
-        other_padding = {
-            'UP': other_target.y,
-            'DOWN': other.dimensions.y - other_target.y,
-            'LEFT': other_target.x,
-            'RIGHT': other.dimensions.x - other_target.x,
-        }
-        padding = {key: value - other_padding[key] for key, value in self_padding.items()}
-        padding = [[key] * abs(value) for key, value in padding.items() if value < 0]
-        padding = [direction for directions in padding for direction in directions]
-        self.pad(padding)
+        # grow just enough for other to fit around the shared target
+        up = max(other_target.y - self_target.y, 0)
+        left = max(other_target.x - self_target.x, 0)
+        down = max((other.height - other_target.y) - (self.height - self_target.y), 0)
+        right = max((other.width - other_target.x) - (self.width - self_target.x), 0)
+        self._grow(up, down, left, right)
+
+        start = (self_target.y + up - other_target.y) * self.width + self_target.x + left - other_target.x
 
-        start_coord = Coord(y=self_target.y - other_target.y, x=self_target.x - other_target.x)
+        # only unknown cells of the overlapped region take the other board's value
+        for y in range(other.height):
+            offset = start + y * self.width
+            row = self.grid[offset:offset + other.width]
 
-        box = self.iter_box(start_coord, other.dimensions)
-        for self_cell, other_cell in zip(box, other):
-            if self_cell.value == 'o':
-                self_cell.value = other_cell.value
+            x = row.find(UNKNOWN)
+            while x != -1:
+                self._put(offset + x, other._value(y * other.width + x))
+                x = row.find(UNKNOWN, x + 1)
 
     def pad(self, directions):
-        if not directions:
-            for y, row in enumerate(self.state):
-                for x, cell in enumerate(row):
-                    cell.y, cell.x = y, x
+        """
+        Grow the board by one unknown row or column per direction.
+
+        :param [str] directions:
+        """
+        self._grow(*(directions.count(key) for key in ('UP', 'DOWN', 'LEFT', 'RIGHT')))
+
+    def _cell(self, index):
+        y, x = divmod(index, self.width)
+        return Cell(y, x, self._value(index))
+
+    def _value(self, index):
+        code = self._code(index)
+        return self.labels[index] if code == LABEL else chr(code)
+
+    def _code(self, index):
+        if self._diff:
+            code = self._diff.get(index)
+            if code is not None:
+                return code
+        return self._grid[index]
+
+    def _put(self, index, value):
+        code = ord(value) if len(value) == 1 else LABEL
+
+        if self.index:
+            old = self._code(index)
+            if old in self.index:
+                self.index[old].discard(index)
+            if code in self.index:
+                self.index[code].add(index)
+
+        if code != LABEL:
+            if self.labels:
+                self.labels.pop(index, None)
+        else:
+            self.labels[index] = value
+
+        if self._diff is None:
+            self._grid[index] = code
             return
 
-        direction = directions.pop()
-
-        if 'LEFT' is direction:
-            self.dimensions.x += 1
-            for row in self.state:
-                row.insert(0, Cell(0, 0, 'o'))
-        if 'RIGHT' is direction:
-            self.dimensions.x += 1
-            for row in self.state:
-                row.append(Cell(0, 0, 'o'))
-        if 'UP' is direction:
-            self.dimensions.y += 1
-            self.state.insert(0, [Cell(0, 0, 'o') for _ in range(self.dimensions.x)])
-        if 'DOWN' is direction:
-            self.dimensions.y += 1
-            self.state.append([Cell(0, 0, 'o') for _ in range(self.dimensions.x)])
-
-        self.pad(directions)
+        self._diff[index] = code
+        if len(self._diff) > len(self._grid) >> 3:
+            self._fold()
 
-    @staticmethod
-    def rotate(state, direction, undo=False):
+    def _grow(self, up, down, left, right):
+        if not any((up, down, left, right)):
+            return
+
+        width, height = self.width + left + right, self.height + up + down
+
+        if left or right or self._diff is not None:
+            grid = bytearray([UNKNOWN]) * (width * height)
+            for y in range(self.height):
+                start = (y + up) * width + left
+                grid[start:start + self.width] = self.grid[y * self.width:(y + 1) * self.width]
+            self._grid, self._diff = grid, None
+        else:
+            # whole rows on a buffer of its own, grow it in place
+            self._grid[:0] = bytes([UNKNOWN]) * (up * width)
+            self._grid += bytes([UNKNOWN]) * (down * width)
+
+        def shift(index):
+            return (index // self.width + up) * width + index % self.width + left
+
+        if left or right or up:
+            self.labels = {shift(index): value for index, value in self.labels.items()}
+            self.index = {code: set(map(shift, indexes)) for code, indexes in self.index.items()}
+        self.index.pop(UNKNOWN, None)
+        self.height, self.width = height, width
+
+    def _fold(self):
+        grid = bytearray(self._grid)
+        for index, code in self._diff.items():
+            grid[index] = code
+        self._grid, self._diff = grid, None
+
+    def _row_str(self, start, end):
+        if not self.labels and not self._diff:
+            return self._grid[start:end].decode(ENCODING)
+        return ''.join(self._value(index) for index in range(start, end))
+
+    def _locate(self, value):
         """
-        :param bool undo:
-        :param str state:
-        :param str direction:
-        :return: Rotated state
-        :rtype: str
+        :param str value:
+        :return: First flat index holding value
+        :rtype: int|None
         """
-        state = [list(line) for line in state.split('\n')]
-        next_state = None
-        re_symbol = re.compile(r'(?P<UP>\^)|(?P<RIGHT>>)|(?P<DOWN>v)|(?P<LEFT><)')
-        sub = {'UP': '^', 'RIGHT': '>', 'DOWN': 'v', 'LEFT': '<'}
+        if len(value) == 1:
+            code = ord(value)
+            indexes = self.index.get(code)
+
+            # index symbols lazily, on first lookup, unless they are too common to be worth tracking
+            if indexes is None and code not in self._unindexed:
+                if self.grid.count(code) > INDEX_LIMIT:
+                    self._unindexed.add(code)
+                else:
+                    indexes = self.index[code] = set(self._positions(value))
 
-        undo_map = {'UP': 'UP', 'DOWN': 'DOWN', 'RIGHT': 'LEFT', 'LEFT': 'RIGHT'}
+            if indexes is None:
+                index = self.grid.find(code)
+                return None if index == -1 else index
+            return min(indexes) if indexes else None
 
-        if undo:
-            direction = undo_map[direction]
+        indexes = [index for index, label in self.labels.items() if label == value]
+        return min(indexes) if indexes else None
 
-        if direction == 'UP':
-            next_state = state
-        if direction == 'RIGHT':
-            next_state = reversed(list(zip(*state)))
-            sub = {'UP': '<', 'RIGHT': '^', 'DOWN': '>', 'LEFT': 'v'}
-        if direction == 'DOWN':
-            next_state = [reversed(args) for args in reversed(state)]
-            sub = {'UP': 'v', 'RIGHT': '<', 'DOWN': '^', 'LEFT': '>'}
-        if direction == 'LEFT':
-            next_state = [reversed(args) for args in zip(*state)]
-            sub = {'UP': '>', 'RIGHT': 'v', 'DOWN': '<', 'LEFT': '^'}
+    def _positions(self, value):
+        """Flat indexes holding a single character value, in row-major order"""
+        grid, code = self.grid, ord(value)
+        STATS.count('cells_scanned', len(grid))
+
+        index = grid.find(code)
+        while index != -1:
+            yield index
+            index = grid.find(code, index + 1)
 
-        if next_state is None:
+    def rotated(self, direction, undo=False):
+        """
+        :param str direction:
+        :param bool undo:
+        :return: A rotated board copy
+        :rtype: Board
+        :raises InvalidTarget:
+        """
+        if undo:
+            direction = UNDO.get(direction, direction)
+
+        if direction not in ROTATE_SYMBOLS:
             msg = 'Direction not in %s' % MOVE.keys()
             raise InvalidTarget(msg)
 
-        def repl(_sub, match):
-            group = match.lastgroup
-            return _sub[group]
+        height, width, slices = rotation(self.height, self.width, direction)
+        grid = self.grid
 
-        repl_partial = partial(repl, sub)
-
-        state_str = '\n'.join(''.join(line) for line in next_state)
+        # noinspection PyPep8Naming
+        BoardClass = self.__class__
+        board = BoardClass()
+        board.grid = bytearray(b''.join([grid[part] for part in slices]).translate(ROTATE_SYMBOLS[direction]))
+        board.height, board.width = height, width
+        board.labels = {self._rotate_index(index, direction): value for index, value in self.labels.items()}
+        return board
+
+    def _rotate_index(self, index, direction):
+        y, x = divmod(index, self.width)
+        if direction == 'RIGHT':
+            return (self.width - 1 - x) * self.height + y
+        if direction == 'DOWN':
+            return self.height * self.width - 1 - index
+        if direction == 'LEFT':
+            return x * self.height + self.height - 1 - y
+        return index
 
-        return re_symbol.sub(repl_partial, state_str)
+    @staticmethod
+    def rotate(state, direction, undo=False):
+        """
+        :param bool undo:
+        :param str state:
+        :param str direction:
+        :return: Rotated state
+        :rtype: str
+        """
+        return str(Board.from_str(state).rotated(direction, undo=undo))
 
 
 class Bot(object):
@@ -354,51 +533,23 @@ class Bot(object):
         return (bot for bot in (self.fork(direction) for direction in directions) if bot)
 
     def find_position(self, master_str):
-        directions = ('UP', 'DOWN', 'LEFT', 'RIGHT')
-        pos = self.cell
-
-        matches = defaultdict(list)
-        orientation = {key: Board.from_str(Board.rotate(master_str, key)) for key in directions}
-
-        master_fork = orientation['UP'].fork()
-
-        for direction, master_board in orientation.items():
-            for cell in master_board.filter('-'):
-                coord = Coord(cell.y - pos.y, cell.x - pos.x)
-
-                if not master_board.is_valid(coord):
-                    continue
-
-                master_box = master_board.iter_box(coord, self.board.dimensions)
-
-                for state_cell, master_cell in zip(self.board, master_box):
-                    if state_cell.value == 'b' and master_cell.value == '-':
-                        continue
-
-                    if state_cell.value == 'o':
-                        continue
-
-                    if state_cell.value != master_cell.value:
-                        break
-                else:
-                    matches[direction].append(cell)
-
-        for direction, master_board in orientation.items():
-            for match in matches[direction]:
-                master_board.set(match, '^')
-
-        master_boards = []
-        for direction, master_board in orientation.items():
-            reoriented_board = Board.rotate(str(master_board), direction, undo=True)
-
-            master_boards.append(Board.from_str(reoriented_board))
+        """
+        :param str master_str:
+        :return: Master copy with each position the explored map fits drawn as its heading symbol
+        :rtype: Board
+        """
+        return Belief.from_board(Board.from_str(master_str), self.board).positions()
 
-        for master_board in master_boards:
-            for cell in master_board.filter('<>v^', cmp=contains):
-                master_fork.set(cell, cell.value)
-        return master_fork
+    def reveal_map(self, move_views, master, distances=None):
+        """
+        Rank moves by how well the views they may reveal narrow down the bot's position.
 
-    def reveal_map(self, move_views, master):
+        :param dict[str, set[str]] move_views: Views each move could reveal
+        :param str master:
+        :param distances: Steps from each master cell to the exit, as distance_field returns them
+        :return: Moves, best first
+        :rtype: [str]
+        """
         # noinspection PyPep8Naming
         BotClass = self.__class__
         moves_data = {}
@@ -406,10 +557,10 @@ class Bot(object):
         move_positions = defaultdict(list)
 
         for direction, views in move_views.items():
-            state = Board.rotate(str(self.board), direction)
+            state = self.board.rotated(direction)
 
             for view in views:
-                fork = Board.from_str(state)
+                fork = state.fork()
                 bot = BotClass(fork)
                 bot.move('UP')
                 bot.board.merge(Board.from_str(view))
@@ -419,14 +570,14 @@ class Bot(object):
                 cells = list(positions.filter('<>v^', cmp=contains))
                 move_positions[direction].append(cells)
 
-        master_board = Board.from_str(master)
-        target = master_board.find('e')
+        distances = distances or exit_distances(master)
+        width = oriented(master, 'UP').width
         for direction, groups in move_positions.items():
             move = {
                 'max': max([len(value) for value in groups]),
                 'mean': mean([len(value) for value in groups]),
                 'cells': groups,
-                'distance': mean([cell.get_distance(target) for group in groups for cell in group])
+                'distance': mean([distances[cell.y * width + cell.x] for group in groups for cell in group])
             }
             moves_data[direction] = move
         results = sorted(
@@ -442,13 +593,12 @@ class Bot(object):
         fork = board.fork()
         fork.set(coord, 'b')
 
-        bot = cls(fork)
         try:
-            bot.move(direction)
+            fork.move(coord, MOVE[direction])
         except InvalidTarget:
             return None
 
-        view = Board.rotate(bot.board.view(fork.find('b')), direction)
+        view = Board.rotate(fork.view(MOVE[direction].resolve(coord)), direction)
         return view
 
     @classmethod
@@ -463,61 +613,613 @@ class Bot(object):
         return dict(moves)
 
     @classmethod
-    def simulate_all_moves(cls, positions_str, master_str):
+    def simulate_all_moves(cls, positions_str, master_str, views=None):
+        """
+        :param str positions_str: Master map with candidate positions drawn as heading symbols
+        :param str master_str:
+        :param ViewCache|None views: Simulated views, the shared VIEWS cache by default
+        :return: Views each move could reveal
+        :rtype: dict[str, set[str]]
+        """
+        views = views or VIEWS
         moves = defaultdict(set)
 
+        positions_board = Board.from_str(positions_str)
+
         for orientation, symbol in SYMBOL.items():
-            positions = Board.from_str(Board.rotate(positions_str, orientation))
-            master = Board.from_str(Board.rotate(master_str, orientation))
+            positions = positions_board.rotated(orientation)
 
             for pos in positions.filter('^'):
-                for direction, view in cls.simulate_each_move(master, pos).items():
+                for direction, view in views.get(master_str, orientation, pos).items():
                     moves[direction].add(view)
 
         return dict(moves)
 
-    def find_path(self, target):
+    def find_path(self, target, search=None):
         """
-        Fork bot in every direction until fastest path to target is found
+        Shortest path to target over walkable cells
 
         :param str|Coord target:
-        :return: Path to target
+        :param search: Search function, bfs by default
+        :return: Path to target, empty when target is missing or unreachable
         :rtype: [str]
         """
-        if not self.board.find(target, None):
+        goal = self.board.find(target, None)
+        if not goal:
             return []
 
-        # noinspection PyPep8Naming
-        BotClass = self.__class__
-        board = self.board.fork()
-        registry = {}
-        bot = BotClass(board, registry=registry, uid=self.uid)
-        target = board.find(target).to_coord()
-
-        bots = tuple(bot.ping())
-        while not registry.get(target):
-            bots = tuple(chain.from_iterable((bot.ping() for bot in bots)))
+        search = search or bfs
+        return search(self.board, self.cell, goal) or []
 
-        path_finder = registry.get(target)
-        return path_finder.uid.split(' ')[1:]
+    def next_move(self, master_str, target='e', belief=None, distances=None):
+        """
+        Get next move
 
-    def next_move(self, master_str, target='e'):
-        """Get next move"""
-        path = self.find_path(target)
+        :param str master_str:
+        :param str target:
+        :param Belief|None belief: Tracked poses, saves localizing from scratch
+        :param distances: Distance field to the exit, see reveal_map
+        :rtype: str
+        """
+        with STATS.phase('find_path'):
+            path = self.find_path(target)
         if path:
             return path.pop(0)
 
-        position = self.find_position(master_str)
-        move_views = Bot.simulate_all_moves(str(position), master_str)
+        with STATS.phase('find_position'):
+            position = belief.positions() if belief else self.find_position(master_str)
+        with STATS.phase('simulate_all_moves'):
+            move_views = Bot.simulate_all_moves(str(position), master_str)
 
-        moves = self.reveal_map(move_views, master_str)
+        with STATS.phase('reveal_map'):
+            moves = self.reveal_map(move_views, master_str, distances=distances)
         return moves[0]
 
     def __repr__(self):
         return '{0.__class__.__name__}(y={0.cell.y}, x={0.cell.x}, uid={0.uid!r})'.format(self)
 
 
+class TemplateMatcher(object):
+    def __init__(self, board):
+        """
+        Match partial maps against every offset of a board at once.
+
+        Each symbol of the board becomes a bit plane, a big int with bit i set where grid[i] holds the symbol.
+        Shifting a plane by a pattern cell's offset and and-ing the planes of all known pattern cells scores
+        every candidate offset in one pass per pattern cell.
+
+        :param Board board:
+        """
+        self.board = board
+        self.planes = {}
+
+    def plane(self, code):
+        """
+        :param int code:
+        :return: Bits set where the board holds code
+        :rtype: int
+        """
+        plane = self.planes.get(code)
+        if plane is None:
+            table = bytearray(b'0') * 256
+            table[code] = ord('1')
+            STATS.count('cells_scanned', len(self.board.grid))
+            plane = self.planes[code] = int(b'0' + self.board.grid.translate(table)[::-1], 2)
+        return plane
+
+    def match(self, pattern, anchor, wildcard='o', anchor_value='-'):
+        """
+        :param Board pattern: Partial map, wildcard cells match anything
+        :param Coord anchor: Pattern cell to report positions of, it matches anchor_value
+        :param str wildcard:
+        :param str anchor_value:
+        :return: Board coords the anchor lands on, for every offset where the pattern fits
+        :rtype: [Coord]
+        """
+        board, width = self.board, self.board.width
+        anchor_index = anchor.y * pattern.width + anchor.x
+
+        known = [(index, ord(anchor_value) if index == anchor_index else code)
+                 for index, code in enumerate(pattern.grid) if code != ord(wildcard)]
+        if not known:
+            return []
+
+        rows = [index // pattern.width for index, _ in known]
+        columns = [index % pattern.width for index, _ in known]
+        top, left = min(rows), min(columns)
+        span_y, span_x = max(rows) - top + 1, max(columns) - left + 1
+        if span_y > board.height or span_x > width:
+            return []
+
+        # offsets where the trimmed pattern fits without wrapping around a row
+        row = b'1' * (width - span_x + 1) + b'0' * (span_x - 1)
+        result = int(b'0' + (row * (board.height - span_y + 1))[::-1], 2)
+
+        for (index, code), y, x in zip(known, rows, columns):
+            result &= self.plane(code) >> ((y - top) * width + x - left)
+            if not result:
+                return []
+
+        shift = (anchor.y - top) * width + anchor.x - left
+        bits = bin(result)[:1:-1]
+
+        coords = []
+        offset = bits.find('1')
+        while offset != -1:
+            y, x = divmod(offset + shift, width)
+            coords.append(Coord(y, x))
+            offset = bits.find('1', offset + 1)
+        return coords
+
+
+class Belief(object):
+    magic = b'MZB1'
+
+    def __init__(self, master, hypotheses=()):
+        """
+        Candidate poses of the bot on the master map.
+
+        A hypothesis packs a master grid index and a heading as ``index << 2 | heading``, where heading is the
+        PATH_STEPS index of the master direction the bot faces.
+
+        :param Board master:
+        :param iterable[int] hypotheses:
+        """
+        self.master = master
+        self.hypotheses = set(hypotheses)
+
+    @classmethod
+    def from_board(cls, master, board, anchor='b'):
+        """
+        :param Board master:
+        :param Board board: Explored map in the bot's frame
+        :param str anchor:
+        :rtype: Belief
+        """
+        matcher = TemplateMatcher(master)
+        hypotheses = set()
+
+        # match the explored map turned into the world frame of each heading, instead of turning the master
+        for heading, direction in enumerate(PATH_STEPS):
+            pattern = board.rotated(direction, undo=True)
+            for coord in matcher.match(pattern, pattern.find(anchor)):
+                hypotheses.add((coord.y * master.width + coord.x) << 2 | heading)
+
+        return cls(master, hypotheses)
+
+    def observe(self, view, wildcard='o'):
+        """
+        Keep hypotheses whose surroundings on the master look like view.
+
+        :param str view: 3x3 view in the bot's frame, its centre is ignored
+        :param str wildcard:
+        """
+        grid, width, height = self.master.grid, self.master.width, self.master.height
+        known = [(position, ord(char)) for position, char in enumerate(view.replace('\n', ''))
+                 if position != 4 and char != wildcard]
+
+        hypotheses = set()
+        for hypothesis in self.hypotheses:
+            y, x = divmod(hypothesis >> 2, width)
+            offsets = view_offsets(hypothesis & 3)
+
+            for position, code in known:
+                dy, dx = offsets[position]
+                if not (0 <= y + dy < height and 0 <= x + dx < width) or grid[(y + dy) * width + x + dx] != code:
+                    break
+            else:
+                hypotheses.add(hypothesis)
+
+        self.hypotheses = hypotheses
+
+    def move(self, direction):
+        """
+        Advance every hypothesis by a move relative to the bot's heading, dropping those walking into a wall.
+
+        :param str direction:
+        """
+        grid, width, height = self.master.grid, self.master.width, self.master.height
+        turn = PATH_STEPS.index(direction)
+
+        hypotheses = set()
+        for hypothesis in self.hypotheses:
+            heading = (hypothesis + turn) & 3
+            step = MOVE[PATH_STEPS[heading]]
+            y, x = divmod(hypothesis >> 2, width)
+            y, x = y + step.y, x + step.x
+
+            if 0 <= y < height and 0 <= x < width and grid[y * width + x] != WALL:
+                hypotheses.add((y * width + x) << 2 | heading)
+
+        self.hypotheses = hypotheses
+
+    def positions(self):
+        """
+        :return: Master copy with each hypothesis drawn as its heading symbol, as find_position draws them
+        :rtype: Board
+        """
+        board = self.master.fork()
+
+        for direction in ('UP', 'DOWN', 'LEFT', 'RIGHT'):
+            heading = PATH_STEPS.index(direction)
+            for hypothesis in self.hypotheses:
+                if hypothesis & 3 == heading:
+                    board._put(hypothesis >> 2, SYMBOL[direction])
+        return board
+
+    @staticmethod
+    def digest(master):
+        return zlib.crc32(master.grid, master.width)
+
+    def dump(self, f):
+        """
+        :param f: Binary file
+        """
+        hypotheses = sorted(self.hypotheses)
+
+        f.write(self.magic)
+        f.write(struct.pack('<II', self.digest(self.master), len(hypotheses)))
+        f.write(struct.pack('<%dI' % len(hypotheses), *hypotheses))
+
+    @classmethod
+    def load(cls, f, master):
+        """
+        :param f: Binary file
+        :param Board master:
+        :return: Stored belief, None when it was stored for another master
+        :rtype: Belief|None
+        """
+        data = f.read()
+        if data[:4] != cls.magic:
+            return None
+
+        digest, count = struct.unpack_from('<II', data, 4)
+        if digest != cls.digest(master):
+            return None
+
+        return cls(master, struct.unpack_from('<%dI' % count, data, 12))
+
+
+class ViewCache(object):
+    def __init__(self, maxsize=VIEW_CACHE_SIZE):
+        """
+        Views simulated from each position of a master map.
+
+        Entries are kept per master grid index, facing UP, and turned to the asked orientation on the way out.
+        Recently used entries are kept up to maxsize; tables filled by precompute are kept whole.
+
+        :param int maxsize:
+        """
+        self.maxsize = maxsize
+        self.views = OrderedDict()
+        self.tables = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, master_str, orientation, coord):
+        """
+        :param str master_str:
+        :param str orientation:
+        :param Coord coord: Position on the master rotated to orientation
+        :return: View revealed by each possible move
+        :rtype: dict[str, str]
+        """
+        master = oriented(master_str, orientation)
+        index = master._rotate_index(coord.y * master.width + coord.x, UNDO[orientation])
+
+        views = self.upright(master_str, index)
+
+        # a move turns the bot to its direction, so from heading h move d reveals what upright move h + d does
+        heading = PATH_STEPS.index(orientation)
+        turned = {direction: PATH_STEPS[(PATH_STEPS.index(direction) + heading) & 3] for direction in MOVE}
+        return {direction: views[upright] for direction, upright in turned.items() if upright in views}
+
+    def upright(self, master_str, index):
+        """
+        :param str master_str:
+        :param int index: Master grid index
+        :return: View revealed by each possible move, facing UP at index
+        :rtype: dict[str, str]
+        """
+        table = self.tables.get(master_str)
+        if table is not None and index in table:
+            self.hits += 1
+            STATS.count('view_cache_hits')
+            return table[index]
+
+        key = (master_str, index)
+        views = self.views.get(key)
+        if views is not None:
+            self.hits += 1
+            STATS.count('view_cache_hits')
+            self.views.move_to_end(key)
+            return views
+
+        self.misses += 1
+        STATS.count('view_cache_misses')
+        master = oriented(master_str, 'UP')
+        views = self.views[key] = Bot.simulate_each_move(master, Coord(*divmod(index, master.width)))
+        if len(self.views) > self.maxsize:
+            self.views.popitem(last=False)
+        return views
+
+    def precompute(self, master_str):
+        """
+        Simulate every open position of a master map, facing UP; other headings are the same views.
+
+        :param str master_str:
+        :return: Views keyed by master grid index
+        :rtype: dict
+        """
+        master = oriented(master_str, 'UP')
+        table = {}
+        for cell in master.filter('-'):
+            table[cell.y * master.width + cell.x] = Bot.simulate_each_move(master, cell)
+
+        self.tables[master_str] = table
+        return table
+
+
+class MazeStore(object):
+    magic = b'MZS3'
+    header = struct.Struct('<4sII')
+    entry = struct.Struct('<9sI')
+
+    def __init__(self, master_str, directory='.'):
+        """
+        Precomputed data about a master map, kept on disk under the map's content hash.
+
+        Sections: the distance field to the exit and the hypotheses (``index << 2 | heading``, as Belief packs
+        them) that each canonical 3x3 view can be seen from. The file is built on first use, or again when it was
+        written in an older format, then memory mapped and decoded section by section as needed.
+
+        :param str master_str:
+        :param str directory:
+        """
+        self.master = Board.from_str(master_str)
+        digest = hashlib.sha1(master_str.encode(ENCODING)).hexdigest()[:16]
+        self.filename = os.path.join(directory, 'maze-%s.bin' % digest)
+        self._data = None
+        self._distances = None
+        self._views = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            if not os.path.isfile(self.filename):
+                self.build()
+            self._data = self._map()
+
+            if self._data[:4] != self.magic:
+                self._data.close()
+                self.build()
+                self._data = self._map()
+        return self._data
+
+    def _map(self):
+        with open(self.filename, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def build(self):
+        master = self.master
+        size = master.height * master.width
+        distances = distance_field(master)
+
+        # only headings whose view is already canonical, positions derives the others
+        views = defaultdict(list)
+        for cell in master.filter('-'):
+            index = cell.y * master.width + cell.x
+            for heading in range(4):
+                key = self.view_key(master, index, heading)
+                if canonical_view(key)[1] == 0:
+                    views[key].append(index << 2 | heading)
+
+        entries = [self.entry.pack(key, len(hypotheses)) + struct.pack('<%dI' % len(hypotheses), *hypotheses)
+                   for key, hypotheses in sorted(views.items())]
+
+        data = b''.join([
+            self.header.pack(self.magic, master.height, master.width),
+            struct.pack('<%dI' % size, *distances),
+            struct.pack('<I', len(entries)),
+        ] + entries)
+
+        write_atomic(self.filename, data)
+
+    @staticmethod
+    def view_key(master, index, heading):
+        """
+        :return: The view at index facing heading, without row breaks, as Board.from_input has it
+        :rtype: bytes
+        """
+        width, height = master.width, master.height
+        y, x = divmod(index, width)
+
+        key = bytearray(b'b' * 9)
+        for position, (dy, dx) in enumerate(view_offsets(heading)):
+            if position != 4:
+                inside = 0 <= y + dy < height and 0 <= x + dx < width
+                key[position] = master.grid[(y + dy) * width + x + dx] if inside else UNKNOWN
+        return bytes(key)
+
+    @property
+    def distances(self):
+        """
+        :return: Steps from each master cell to the exit, UNREACHABLE through walls
+        :rtype: tuple
+        """
+        if self._distances is None:
+            size = self.master.height * self.master.width
+            self._distances = struct.unpack_from('<%dI' % size, self.data, self.header.size)
+        return self._distances
+
+    def positions(self, view):
+        """
+        :param str view: 3x3 view in the bot's frame
+        :return: Hypotheses the view can be seen from
+        :rtype: set[int]
+        """
+        if self._views is None:
+            data = self.data
+            size = self.master.height * self.master.width
+            offset = self.header.size + 4 * size
+            count, = struct.unpack_from('<I', data, offset)
+            offset += 4
+
+            self._views = {}
+            for _ in range(count):
+                key, length = self.entry.unpack_from(data, offset)
+                offset += self.entry.size
+                self._views[key] = offset, length
+                offset += 4 * length
+
+        key = bytearray(view.replace('\n', ''), ENCODING)
+        key[4] = ord('b')
+        key, turn = canonical_view(bytes(key))
+
+        # the view turned by turn is seen facing turn more than the view itself
+        offset, length = self._views.get(key, (0, 0))
+        return {hypothesis & ~3 | (hypothesis - turn) & 3
+                for hypothesis in struct.unpack_from('<%dI' % length, self.data, offset)}
+
+
+class OpeningBook(object):
+    magic = b'MZO1'
+    header = struct.Struct('<4sII')
+    entry = struct.Struct('<8sB')
+
+    def __init__(self, master, moves=None):
+        """
+        Moves the full search picked for explored maps seen before, learned offline from recorded games and
+        the simulator.
+
+        The explored map in the bot's frame fixes the belief, and with it the searched move, so a map's
+        digest is enough of a key.
+
+        :param Board master:
+        :param dict[bytes, str]|None moves:
+        """
+        self.master = master
+        self.moves = moves or {}
+
+    def __len__(self):
+        return len(self.moves)
+
+    @staticmethod
+    def key(board):
+        """
+        :param Board board: Explored map in the bot's frame
+        :rtype: bytes
+        """
+        shape = struct.pack('<II', board.height, board.width)
+        return hashlib.blake2b(shape + bytes(board.grid), digest_size=8).digest()
+
+    def get(self, board):
+        """
+        :param Board board:
+        :return: Stored move, None for maps not in the book
+        :rtype: str|None
+        """
+        return self.moves.get(self.key(board))
+
+    def add(self, board, move):
+        """
+        :param Board board:
+        :param str move:
+        """
+        self.moves.setdefault(self.key(board), move)
+
+    def dump(self, f):
+        """
+        :param f: Binary file
+        """
+        f.write(self.header.pack(self.magic, Belief.digest(self.master), len(self.moves)))
+        for key, move in sorted(self.moves.items()):
+            f.write(self.entry.pack(key, PATH_STEPS.index(move)))
+
+    @classmethod
+    def load(cls, f, master):
+        """
+        :param f: Binary file
+        :param Board master:
+        :return: Stored book, None when it was stored for another master
+        :rtype: OpeningBook|None
+        """
+        data = f.read()
+        if len(data) < cls.header.size:
+            return None
+
+        magic, digest, count = cls.header.unpack_from(data)
+        if magic != cls.magic or digest != Belief.digest(master):
+            return None
+
+        entries = cls.entry.iter_unpack(data[cls.header.size:cls.header.size + count * cls.entry.size])
+        return cls(master, {key: PATH_STEPS[move] for key, move in entries})
+
+
+class Stats(object):
+    def __init__(self, enabled=False):
+        """
+        Opt-in wall time and calls of the bot's phases, and counters of its work: boards forked, cells scanned,
+        view cache and opening book hits and misses. Phases nest, a phase's time includes the phases inside it.
+
+        Disabled, phase and count do nothing, so the hooks stay in hot paths at the cost of a call.
+
+        :param bool enabled:
+        """
+        self.enabled = enabled
+        self.phases = {}
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        :param str name:
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            calls, seconds = self.phases.get(name, (0, 0.0))
+            self.phases[name] = calls + 1, seconds + perf_counter() - start
+
+    def count(self, name, amount=1):
+        """
+        :param str name:
+        :param int amount:
+        """
+        if self.enabled:
+            self.counters[name] += amount
+
+    def report(self):
+        """
+        Timings and counters since the last report, starting over.
+
+        :return: ``{"phases": {name: {"calls": n, "ms": ms}}, "counters": {name: n}}``
+        :rtype: dict
+        """
+        report = {
+            'phases': {name: {'calls': calls, 'ms': round(seconds * 1000, 3)}
+                       for name, (calls, seconds) in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+        self.phases, self.counters = {}, defaultdict(int)
+        return report
+
+    def dump(self, f):
+        """
+        :param f: Text file, gets one ``{"stats": report}`` JSON line
+        """
+        f.write(json.dumps({'stats': self.report()}, sort_keys=True) + '\n')
+        f.flush()
+
+
 class Cartesian(object):
+    __slots__ = ('y', 'x')
+
     def __init__(self, y, x):
         """
         :param int y:
@@ -537,6 +1239,8 @@ class Cartesian(object):
 
 
 class Coord(Cartesian):
+    __slots__ = ()
+
     def to_cell(self, value):
         """
         :param str value:
@@ -573,13 +1277,16 @@ class Coord(Cartesian):
 
 
 class Cell(Coord):
+    __slots__ = ('value',)
+
     def __init__(self, y, x, value):
         """
         :param int y:
         :param int x:
         :param str value:
         """
-        super(Cell, self).__init__(y, x)
+        self.y = y
+        self.x = x
         self.value = value
 
     def to_cell(self, value=None):
@@ -598,6 +1305,8 @@ class Cell(Coord):
 
 
 class Delta(Cartesian):
+    __slots__ = ()
+
     def resolve(self, start):
         """
         :param Coord start:
@@ -610,7 +1319,7 @@ class Delta(Cartesian):
 
 
 class Dimensions(Cartesian):
-    pass
+    __slots__ = ()
 
 
 class InvalidTarget(Exception):
@@ -631,6 +1340,332 @@ SYMBOL = {
     'RIGHT': '>',
 }
 
+UNDO = {'UP': 'UP', 'DOWN': 'DOWN', 'RIGHT': 'LEFT', 'LEFT': 'RIGHT'}
+
+ROTATE_SYMBOLS = {
+    'UP': bytes.maketrans(b'', b''),
+    'RIGHT': bytes.maketrans(b'^>v<', b'<^>v'),
+    'DOWN': bytes.maketrans(b'^>v<', b'v<^>'),
+    'LEFT': bytes.maketrans(b'^>v<', b'>v<^'),
+}
+
+VIEWS = ViewCache()
+STATS = Stats()
+
+MASTER = dedent("""
+    #######
+    #--#--#
+    #--#--#
+    #--#--#
+    e-----#
+    #-----#
+    #######
+""")[1:-1]
+
+
+PATH_STEPS = ('UP', 'RIGHT', 'DOWN', 'LEFT')
+OPPOSITE = {'UP': 'DOWN', 'DOWN': 'UP', 'LEFT': 'RIGHT', 'RIGHT': 'LEFT'}
+
+
+class PathGrid(object):
+    def __init__(self, board, goal, walkable='-e'):
+        """
+        Walkable mask of a board, framed by a wall border so neighbours never need bounds checks.
+
+        :param Board board:
+        :param Coord goal:
+        :param str walkable:
+        """
+        table = bytearray(256)
+        for char in walkable:
+            table[ord(char)] = 1
+
+        self.width = board.width + 1
+        self.height = board.height + 2
+        self.offsets = (-self.width, 1, self.width, -1)  # in PATH_STEPS order
+
+        rows = (board.grid[y * board.width:(y + 1) * board.width] for y in range(board.height))
+        self.mask = bytearray(self.width) + b'\x00'.join(rows).translate(table) + bytearray(self.width + 1)
+        self.mask[self.to_index(goal)] = 1
+        STATS.count('cells_scanned', board.height * board.width)
+
+    def to_index(self, coord):
+        return (coord.y + 1) * self.width + coord.x
+
+    def trace(self, steps, start, end, backwards=False):
+        """
+        Follow parent pointers from end back to start.
+
+        :param bytearray steps: Step taken into each cell, 1-based PATH_STEPS index
+        :param int start:
+        :param int end:
+        :param bool backwards: Steps were recorded walking away from the goal
+        :return: Directions from start to end, or end to start when backwards
+        :rtype: [str]
+        """
+        path = []
+        index = end
+        while index != start:
+            step = steps[index] - 1
+            index -= self.offsets[step]
+            path.append(OPPOSITE[PATH_STEPS[step]] if backwards else PATH_STEPS[step])
+
+        return path if backwards else path[::-1]
+
+
+def bfs(board, start, goal):
+    """
+    Breadth first search, expanding neighbours in PATH_STEPS order.
+
+    :param Board board:
+    :param Coord start:
+    :param Coord goal:
+    :return: Shortest path, or None when goal is unreachable
+    :rtype: [str]|None
+    """
+    grid = PathGrid(board, goal)
+    mask, offsets = grid.mask, grid.offsets
+    start, goal = grid.to_index(start), grid.to_index(goal)
+
+    steps = bytearray(len(mask))
+    mask[start] = 0
+    frontier = [start]
+
+    while frontier and not steps[goal]:
+        next_frontier = []
+        for index in frontier:
+            for step, offset in enumerate(offsets, 1):
+                neighbour = index + offset
+                if mask[neighbour]:
+                    mask[neighbour] = 0
+                    steps[neighbour] = step
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+
+    if start != goal and not steps[goal]:
+        return None
+    return grid.trace(steps, start, goal)
+
+
+def astar(board, start, goal):
+    """
+    A* search with a Manhattan distance heuristic.
+
+    :param Board board:
+    :param Coord start:
+    :param Coord goal:
+    :return: Shortest path, or None when goal is unreachable
+    :rtype: [str]|None
+    """
+    grid = PathGrid(board, goal)
+    mask, offsets, width = grid.mask, grid.offsets, grid.width
+    start, goal = grid.to_index(start), grid.to_index(goal)
+    goal_y, goal_x = divmod(goal, width)
+
+    steps = bytearray(len(mask))
+    costs = {start: 0}
+    heap = [(0, 0, start)]
+    mask[start] = 0
+
+    # ties on estimate go to the deepest cell first
+    while heap:
+        _, cost, index = heappop(heap)
+        cost = -cost
+        if index == goal:
+            return grid.trace(steps, start, goal)
+        if cost > costs[index]:
+            continue
+
+        cost += 1
+        for step, offset in enumerate(offsets, 1):
+            neighbour = index + offset
+            if mask[neighbour] and cost < costs.get(neighbour, cost + 1):
+                costs[neighbour] = cost
+                steps[neighbour] = step
+                y, x = divmod(neighbour, width)
+                heappush(heap, (cost + abs(goal_y - y) + abs(goal_x - x), -cost, neighbour))
+
+    return None
+
+
+def bidirectional(board, start, goal):
+    """
+    Breadth first search from both ends, always growing the smaller frontier.
+
+    :param Board board:
+    :param Coord start:
+    :param Coord goal:
+    :return: Shortest path, or None when goal is unreachable
+    :rtype: [str]|None
+    """
+    grid = PathGrid(board, goal)
+    mask, offsets = grid.mask, grid.offsets
+    start, goal = grid.to_index(start), grid.to_index(goal)
+    if start == goal:
+        return []
+
+    sides = {
+        True: (start, bytearray(len(mask)), [start]),
+        False: (goal, bytearray(len(mask)), [goal]),
+    }
+    mask[start] = mask[goal] = 0
+
+    while sides[True][2] and sides[False][2]:
+        is_forward = len(sides[True][2]) <= len(sides[False][2])
+        root, steps, frontier = sides[is_forward]
+        other_root, other, other_frontier = sides[not is_forward]
+
+        # the other side's cells are at its frontier depth or one less, prefer the shallower meeting point
+        meeting, latest = None, None
+        next_frontier = []
+        for index in frontier:
+            for step, offset in enumerate(offsets, 1):
+                neighbour = index + offset
+                if mask[neighbour]:
+                    mask[neighbour] = 0
+                    steps[neighbour] = step
+                    next_frontier.append(neighbour)
+                elif other[neighbour] or neighbour == other_root:
+                    latest = latest or set(other_frontier)
+                    if meeting is None or meeting[0] in latest and neighbour not in latest:
+                        meeting = neighbour, index, step
+
+        if meeting is not None:
+            neighbour, index, step = meeting
+            if is_forward:
+                path = grid.trace(steps, start, index) + [PATH_STEPS[step - 1]]
+                return path + grid.trace(other, goal, neighbour, backwards=True)
+            path = grid.trace(other, start, neighbour) + [OPPOSITE[PATH_STEPS[step - 1]]]
+            return path + grid.trace(steps, goal, index, backwards=True)
+
+        sides[is_forward] = root, steps, next_frontier
+
+    return None
+
+
+def distance_field(board, target='e'):
+    """
+    Breadth first search out of target over walkable cells.
+
+    :param Board board:
+    :param str target:
+    :return: Steps from every cell to target, UNREACHABLE where there is no path
+    :rtype: array
+    """
+    goal = board.find(target)
+    grid = PathGrid(board, goal)
+    mask, offsets = grid.mask, grid.offsets
+
+    start = grid.to_index(goal)
+    distances = array('I', [UNREACHABLE]) * len(mask)
+    distances[start] = 0
+    mask[start] = 0
+
+    distance = 0
+    frontier = [start]
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for index in frontier:
+            for offset in offsets:
+                neighbour = index + offset
+                if mask[neighbour]:
+                    mask[neighbour] = 0
+                    distances[neighbour] = distance
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+
+    # drop the wall border
+    rows = (grid.to_index(Coord(y, 0)) for y in range(board.height))
+    return array('I', chain.from_iterable(distances[row:row + board.width] for row in rows))
+
+
+@lru_cache(maxsize=128)
+def rotation(height, width, direction):
+    """
+    Rotation of a flat grid, as the slices that make up each row of the rotated grid.
+
+    :param int height:
+    :param int width:
+    :param str direction:
+    :return: Rotated height, rotated width and slices
+    :rtype: (int, int, (slice,))
+    """
+    size = height * width
+
+    if direction == 'RIGHT':
+        return width, height, tuple(slice(width - 1 - x, size, width) for x in range(width))
+    if direction == 'DOWN':
+        return height, width, (slice(None, None, -1),)
+    if direction == 'LEFT':
+        return width, height, tuple(slice(size - width + x, None, -width) for x in range(width))
+    return height, width, (slice(None),)
+
+
+@lru_cache(maxsize=None)
+def view_offsets(heading):
+    """
+    :param int heading: PATH_STEPS index
+    :return: (dy, dx) on the master of each cell of a 3x3 view, in view order
+    :rtype: ((int, int),)
+    """
+    _, _, slices = rotation(3, 3, PATH_STEPS[heading])
+    order = b''.join(bytes(range(9))[part] for part in slices)
+
+    return tuple((index // 3 - 1, index % 3 - 1) for index in order)
+
+
+@lru_cache(maxsize=None)
+def canonical_view(view):
+    """
+    :param bytes view: 3x3 view without row breaks
+    :return: Smallest rotation of the view, and the PATH_STEPS index of the direction it is rotated in
+    :rtype: (bytes, int)
+    """
+    rotations = []
+    for heading, direction in enumerate(PATH_STEPS):
+        _, _, slices = rotation(3, 3, direction)
+        rotations.append((b''.join(view[part] for part in slices), heading))
+
+    return min(rotations)
+
+
+@lru_cache(maxsize=16)
+def oriented(master_str, orientation):
+    """
+    :param str master_str:
+    :param str orientation:
+    :return: Master board rotated to orientation, shared between callers so treat as read only
+    :rtype: Board
+    """
+    return Board.from_str(master_str).rotated(orientation)
+
+
+@lru_cache(maxsize=16)
+def exit_distances(master_str):
+    """
+    :param str master_str:
+    :return: Distance field to the master's exit
+    :rtype: array
+    """
+    return distance_field(Board.from_str(master_str))
+
+
+@lru_cache(maxsize=16)
+def opening_book(master_str, filename=BOOK):
+    """
+    :param str master_str:
+    :param str filename:
+    :return: Book stored for the master, empty when missing or stored for another master
+    :rtype: OpeningBook
+    """
+    master = Board.from_str(master_str)
+    if not os.path.isfile(filename):
+        return OpeningBook(master)
+
+    with open(filename, 'rb') as f:
+        return OpeningBook.load(f, master) or OpeningBook(master)
+
 
 def mean(items):
     return sum(items) / len(items)
@@ -666,33 +1701,347 @@ def dump(filename, board, next_move):
         board.dump(f, next_move)
 
 
+def load_belief(filename, master):
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, 'rb') as f:
+        return Belief.load(f, master)
+
+
+def dump_belief(filename, belief):
+    with open(filename, 'wb') as f:
+        belief.dump(f)
+
+
+def write_atomic(filename, data):
+    """
+    Write next to the target and rename, so readers and killed runs never leave a partial file.
+
+    :param str filename:
+    :param bytes data:
+    """
+    path = '%s.%d.tmp' % (filename, os.getpid())
+    with open(path, 'wb') as f:
+        f.write(data)
+    os.replace(path, filename)
+
+
+class TextStateStore(object):
+    def __init__(self, directory='.'):
+        """
+        Session state between runs as text: the last move and the explored map in moves.txt, and belief.bin.
+
+        Slower to write and parse than PackedStateStore, kept to read along while debugging.
+
+        :param str directory:
+        """
+        self.filename = os.path.join(directory, 'moves.txt')
+        self.belief_filename = os.path.join(directory, 'belief.bin')
+
+    def load(self, session):
+        """
+        :param Session session: Session to restore the explored map and belief of
+        """
+        session.board = load(self.filename)
+        if session.board:
+            session.belief = load_belief(self.belief_filename, session.store.master)
+
+    def dump(self, session):
+        """
+        :param Session session:
+        """
+        dump(self.filename, session.board, session.move)
+        dump_belief(self.belief_filename, session.belief)
+
+
+class PackedStateStore(object):
+    magic = b'MZT1'
+    header = struct.Struct('<4sIIIBI')
+
+    def __init__(self, directory='.'):
+        """
+        Session state between runs as one binary file.
+
+        Header: the master's Belief.digest, the explored map's height and width, the last move's PATH_STEPS
+        index (255 when none) and the number of hypotheses. Then the map's grid and the hypotheses as uint32. The
+        map is stored before catching up with the last move, Session.observe does that on the next turn.
+
+        :param str directory:
+        """
+        self.filename = os.path.join(directory, 'state.bin')
+
+    def load(self, session):
+        """
+        :param Session session: Session to restore the explored map, last move and belief of
+        """
+        if not os.path.isfile(self.filename) or not os.path.getsize(self.filename):
+            return
+
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        if data[:4] != self.magic:
+            return
+
+        _, digest, height, width, move, count = self.header.unpack_from(data)
+        offset = self.header.size
+        size = height * width
+
+        board = Board()
+        board.grid = bytearray(data[offset:offset + size])
+        board.height, board.width = height, width
+
+        session.board = board
+        session.move = PATH_STEPS[move] if move < len(PATH_STEPS) else None
+        if digest == Belief.digest(session.store.master):
+            session.belief = Belief(session.store.master, struct.unpack_from('<%dI' % count, data, offset + size))
+
+    def dump(self, session):
+        """
+        :param Session session:
+        """
+        board, master = session.board, session.store.master
+        hypotheses = sorted(session.belief.hypotheses) if session.belief else []
+        move = PATH_STEPS.index(session.move) if session.move else 255
+
+        data = b''.join([
+            self.header.pack(self.magic, Belief.digest(master), board.height, board.width, move, len(hypotheses)),
+            bytes(board.grid),
+            struct.pack('<%dI' % len(hypotheses), *hypotheses),
+        ])
+
+        write_atomic(self.filename, data)
+
+
+class Session(object):
+    def __init__(self, master=MASTER, store=None, book=None):
+        """
+        One game of the bot, kept in memory between turns.
+
+        :param str master:
+        :param MazeStore|None store:
+        :param OpeningBook|None book: Consulted before searching, BOOK by default
+        """
+        self.master = master
+        self.store = store or MazeStore(master)
+        self.book = book if book is not None else opening_book(master)
+        self.board = None
+        self.belief = None
+        self.move = None
+
+    def turn(self, data):
+        """
+        :param str data: Game input, the player id and a 3x3 view
+        :return: Next move
+        :rtype: str
+        """
+        with STATS.phase('turn'):
+            with STATS.phase('observe'):
+                self.observe(data)
+            with STATS.phase('decide'):
+                return self.play(self.decide())
+
+    def observe(self, data):
+        """
+        Catch up with the last move and merge a view into the explored map and the belief.
+
+        :param str data: Game input, the player id and a 3x3 view
+        """
+        master_board = self.store.master
+        next_state = Board.from_input(data)
+
+        # catch up with the last move, as Board.load does for moves.txt
+        if self.move:
+            self.board = self.board.rotated(self.move)
+            self.board.move('b', MOVE['UP'])
+            self.move = None
+
+        if self.board:
+            self.board.merge(next_state)
+        else:
+            self.board = next_state
+            self.belief = Belief(master_board, self.store.positions(str(next_state)))
+
+        if self.belief and self.board is not next_state:
+            self.belief.observe(str(next_state))
+        if not self.belief or not self.belief.hypotheses:
+            self.belief = Belief.from_board(master_board, self.board)
+
+    def decide(self):
+        """
+        :return: The book's move for the explored map, searched for when it is not in the book
+        :rtype: str
+        """
+        move = self.book.get(self.board)
+        STATS.count('book_hits' if move else 'book_misses')
+
+        return move or self.search()
+
+    def search(self):
+        """
+        :rtype: str
+        """
+        with STATS.phase('search'):
+            bot = Bot(self.board)
+            return bot.next_move(self.master, belief=self.belief, distances=self.store.distances)
+
+    def play(self, move):
+        """
+        :param str move: Move made from the explored map
+        :rtype: str
+        """
+        self.move = move
+        self.belief.move(move)
+
+        return move
+
+
+def next_moves(states, processes=None, directory=None):
+    """
+    Next move for each of many game states, sharing per master work between them.
+
+    States on the same master share its MazeStore, opening book and view cache; masters with PRECOMPUTE_BATCH
+    states or more have every view simulated up front. Batches of PARALLEL_BATCH states or more are spread
+    over processes.
+
+    :param iterable[(Board|str, str)] states: Explored map in the bot's frame, and the master it is played on
+    :param int|None processes: Worker processes, 1 to stay in this process, every core for large batches by default
+    :param str|None directory: Where maze stores are kept and BOOK is read from, a temporary directory by default
+    :return: Moves, in the order of states
+    :rtype: [str]
+    """
+    states = [(str(board), master) for board, master in states]
+    if not states:
+        return []
+
+    if directory is None:
+        with TemporaryDirectory() as directory:
+            return next_moves(states, processes, directory)
+
+    if processes is None:
+        processes = os.cpu_count() if len(states) >= PARALLEL_BATCH else 1
+
+    if processes <= 1:
+        return _next_moves(states, directory)
+
+    # chunks of the same master, so each process only builds what its states need
+    order = sorted(range(len(states)), key=lambda index: states[index][1])
+    size = -(-len(order) // (processes * 4))
+    chunks = [order[start:start + size] for start in range(0, len(order), size)]
+
+    moves = [None] * len(states)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(_next_moves, [[states[index] for index in chunk] for chunk in chunks],
+                               [directory] * len(chunks))
+        for chunk, chunk_moves in zip(chunks, results):
+            for index, move in zip(chunk, chunk_moves):
+                moves[index] = move
+    return moves
+
+
+def _next_moves(states, directory):
+    by_master = defaultdict(list)
+    for index, (_, master) in enumerate(states):
+        by_master[master].append(index)
+
+    moves = [None] * len(states)
+    for master, indexes in by_master.items():
+        store = MazeStore(master, directory)
+        book = opening_book(master, os.path.join(directory, BOOK))
+        if len(indexes) >= PRECOMPUTE_BATCH and master not in VIEWS.tables:
+            VIEWS.precompute(master)
+
+        for index in indexes:
+            session = Session(master, store=store, book=book)
+            session.board = Board.from_str(states[index][0])
+            session.belief = Belief.from_board(store.master, session.board)
+            moves[index] = session.decide()
+    return moves
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    """
+    Play games over a line-delimited JSON protocol, keeping sessions between moves.
+
+    Requests are ``{"game": id, "input": data}``, with ``"master"`` on a game's first turn, or
+    ``{"game": id, "end": true}`` once a game is over. Each request gets one response line,
+    ``{"game": id, "move": move}`` or ``{"game": id, "error": message}``, with the move's ``"stats"`` report
+    while STATS is enabled; a line that is not a request gets ``{"game": null, "error": message}``. The least
+    recently played session is dropped past MAX_SESSIONS, a turn of a game without a session and no ``"master"``
+    is an error.
+
+    :param stdin:
+    :param stdout:
+    """
+    sessions = OrderedDict()
+
+    for line in iter(stdin.readline, ''):
+        # a request that can't be read is answered without a game
+        response = {'game': None}
+        ended = False
+
+        try:
+            request = json.loads(line)
+            game = response['game'] = request.get('game')
+
+            if request.get('end'):
+                ended = True
+                sessions.pop(game, None)
+            else:
+                session = sessions.pop(game, None)
+                if session is None:
+                    # a dropped game can't be picked up mid-way as a new game on MASTER
+                    if 'master' not in request:
+                        raise ValueError('Game %r has no session, its first turn needs a master' % game)
+                    session = Session(request['master'])
+                sessions[game] = session
+                if len(sessions) > MAX_SESSIONS:
+                    sessions.popitem(last=False)
+
+                response['move'] = session.turn(request['input'])
+        except Exception:
+            response['error'] = traceback.format_exc()
+
+        if STATS.enabled and not ended:
+            response['stats'] = STATS.report()
+
+        stdout.write(json.dumps(response) + '\n')
+        stdout.flush()
+
+
 def main():
-    master = dedent("""
-        #######
-        #--#--#
-        #--#--#
-        #--#--#
-        e-----#
-        #-----#
-        #######
-    """)[1:-1]
-    filename = 'moves.txt'
-
-    board = load(filename)
-    data = sys.stdin.read().rstrip()
-    next_state = Board.from_input(data)
-    if board:
-        board.merge(next_state)
-    else:
-        board = next_state
+    args = sys.argv[1:]
 
-    bot = Bot(board)
-    next_move = bot.next_move(master)
+    # --stats reports to stderr, --stats=FILE appends to a file, one JSON line per move
+    stats_file = None
+    for arg in args:
+        option, _, value = arg.partition('=')
+        if option == '--stats':
+            STATS.enabled, stats_file = True, value or None
 
-    dump(filename, board, next_move)
+    if '--worker' in args:
+        return serve()
+
+    # moves.txt can be read along while debugging, state.bin is smaller and faster to load
+    state = TextStateStore() if '--text' in args else PackedStateStore()
+
+    session = Session()
+    with STATS.phase('load_state'):
+        state.load(session)
+
+    next_move = session.turn(sys.stdin.read().rstrip())
+
+    with STATS.phase('dump_state'):
+        state.dump(session)
 
     print(next_move)
 
+    if stats_file:
+        with open(stats_file, 'a') as f:
+            STATS.dump(f)
+    elif STATS.enabled:
+        STATS.dump(sys.stderr)
+
 
 if __name__ == '__main__':
     main()
@@ -1,34 +1,70 @@
 # coding=utf-8
-import json
 import os.path
+from argparse import ArgumentParser
 from time import sleep
 
-REPLAY = 'moves.json'
+try:
+    from .gamelog import open_log, read_log
+except ImportError:  # run as a script
+    from gamelog import open_log, read_log
+
+REPLAY = 'moves.jsonl'
 BASE_PATH = os.path.abspath(os.path.dirname(__file__))
+DELAY = 1.0
 
 
-def main():
-    with open(os.path.join(BASE_PATH, REPLAY)) as f:
-        moves = json.load(f)
-
-    for move in moves:
-        print()
-        print('{:=^40}'.format(' MOVE %s ' % move['move']))
-        print()
-        if move['stderr']:
-            print('STDERR')
-            print(move['stderr'])
+def replay(log, start=0, delay=DELAY):
+    """Print each move of a game log, from move start on"""
+
+    with open_log(log) as f:
+        for move in read_log(f, start=start):
+            if 'outcome' in move:
+                print()
+                print('{:=^40}'.format(' %s IN %s MOVES ' % (move['outcome'].upper(), move['moves'])))
+                if move['message']:
+                    print(move['message'])
+                continue
+
+            print()
+            print('{:=^40}'.format(' MOVE %s ' % move['move']))
+            print()
+            if move['stderr']:
+                print('STDERR')
+                print(move['stderr'])
+                print()
+
+            print('STDOUT')
+            print(move['stdout'])
             print()
 
-        print('STDOUT')
-        print(move['stdout'])
-        print()
+            print('STDIN')
+            print(move['stdin'])
+            print()
 
-        print('STDIN')
-        print(move['stdin'])
-        print()
+            if delay:
+                sleep(delay)
+
+
+def create_parser():
+    """Create an argument parser"""
+
+    parser = ArgumentParser(description='Replay a maze escape game log.')
+    parser.add_argument('log', nargs='?', default=os.path.join(BASE_PATH, REPLAY),
+                        help='Game log, JSON lines or an old JSON array, optionally .gz or .zst (%s)' % REPLAY)
+    parser.add_argument('-s', '--start', default=0, type=int,
+                        help='Move index to start from (0)')
+    parser.add_argument('-d', '--delay', default=DELAY, type=float,
+                        help='Seconds between moves (%s)' % DELAY)
+    parser.add_argument('--fast', action='store_const', const=0, dest='delay',
+                        help='Replay without pausing between moves')
+
+    return parser.parse_args()
+
+
+def main():
+    args = create_parser()
 
-        sleep(1)
+    replay(args.log, args.start, args.delay)
 
 
 if __name__ == '__main__':
@@ -2,28 +2,58 @@
 # coding=utf-8
 from __future__ import print_function
 
+import importlib.util
 import json
 import os.path
 import shutil
 import subprocess
 import sys
-from argparse import ArgumentParser, FileType
-from contextlib import contextmanager, closing
+import threading
+import traceback
+from argparse import ArgumentParser
+from contextlib import contextmanager, closing, redirect_stderr
 from functools import partial
+from io import StringIO
+from queue import Empty, Queue
 from tempfile import mkdtemp
 from textwrap import dedent
 
+try:
+    from .gamelog import open_log, write_log
+except ImportError:  # run as a script
+    from gamelog import open_log, write_log
+
 BASE_PATH = partial(os.path.join, os.path.abspath(os.path.dirname(__file__)))
 
 # DEFAULTS
 TARGET = BASE_PATH('main.py')
-MOVES = BASE_PATH('moves.json')
+MOVES = BASE_PATH('moves.jsonl')
+BOOK_NAME = 'book.bin'  # main.BOOK
+BOOK = BASE_PATH(BOOK_NAME)
 MAX_MOVES = 50
 EXECUTABLE = sys.executable
+ENGINE = 'auto'
+TIMEOUT = 10.0
+STATS_PREFIX = '{"stats"'
+
+# OUTCOMES
+WON = 'won'
+LOST = 'lost'
+UNFINISHED = 'unfinished'
+
+# facings in turning order, the step forward and the view around the bot for each
+FACINGS = ('UP', 'RIGHT', 'DOWN', 'LEFT')
+STEPS = ((-1, 0), (0, 1), (1, 0), (0, -1))
+VIEW_OFFSETS = tuple(
+    tuple((-row * forward[0] + column * right[0], -row * forward[1] + column * right[1])
+          for row in (-1, 0, 1) for column in (-1, 0, 1))
+    for forward, right in zip(STEPS, STEPS[1:] + STEPS[:1])
+)
 
 
 class Board(object):
-    _state = []
+    """Maze kept in world orientation, tracking where the bot is and which way it faces"""
+
     op = {
         'LEFT': lambda y, x: (y, x - 1),
         'RIGHT': lambda y, x: (y, x + 1),
@@ -31,16 +61,24 @@ class Board(object):
         'DOWN': lambda y, x: (y + 1, x),
     }
 
-    def __init__(self, state):
+    def __init__(self, state, facing='UP'):
         self.state = state
+        self.facing = FACINGS.index(facing)
 
     @property
     def state(self):
-        return self._state
+        """Cells as the bot sees them, turned to its facing"""
+
+        if not self.facing:
+            return self.world
+        return [list(row) for row in self.rotate(self.to_string(self.world), FACINGS[self.facing]).split('\n')]
 
     @state.setter
     def state(self, value):
-        self._state = [[char for char in row] for row in value.split('\n') if row]
+        self.world = [[char for char in row] for row in value.split('\n') if row]
+        self.facing = 0
+        self.position = next(((y, x) for y, row in enumerate(self.world) for x, char in enumerate(row) if char == 'b'),
+                             None)
 
     def __iter__(self):
         """Iterate cells in state"""
@@ -50,6 +88,9 @@ class Board(object):
     def find(self, target='b'):
         """Find cell coord by character"""
 
+        if target == 'b' and self.position:
+            return self.to_state(*self.position)
+
         for (y, x, char) in self:
             if char == target:
                 return y, x
@@ -59,12 +100,23 @@ class Board(object):
     def set(self, y, x, value):
         """Set cell in state to value"""
 
-        target = self.state[y][x]
+        self.put(*self.to_world(y, x), value=value)
+
+    def put(self, y, x, value):
+        """Set cell in world to value"""
+
+        target = self.world[y][x]
 
         if target == '#':
             raise InvalidTarget('Cannot cross #')
 
-        self.state[y][x] = value
+        self.world[y][x] = value
+
+        # keep track of the bot
+        if value == 'b':
+            self.position = y, x
+        elif self.position == (y, x):
+            self.position = None
 
         if target == 'e':
             raise GameWon()
@@ -76,27 +128,47 @@ class Board(object):
         if direction not in self.op.keys():
             raise InvalidTarget('Direction not in UP LEFT RIGHT DOWN')
 
-        # rotate state
-        self.state = self.rotate(str(self), direction)
+        # turn the bot, instead of rotating the state
+        self.facing = (self.facing + FACINGS.index(direction)) % 4
 
         # move bot
-        pos_y, pos_x = self.find()  # get bot pos
-        next_y, next_x = self.op['UP'](pos_y, pos_x)  # get next bot pos
+        if not self.position:
+            raise InvalidTarget()
+        pos_y, pos_x = self.position  # get bot pos
+        step_y, step_x = STEPS[self.facing]
 
-        self.set(pos_y, pos_x, '-')  # remove bot
-        self.set(next_y, next_x, 'b')  # set bot
+        self.put(pos_y, pos_x, '-')  # remove bot
+        self.put(pos_y + step_y, pos_x + step_x, 'b')  # set bot
 
     def view(self):
         """Get bot's POV"""
 
-        pos_y, pos_x = self.find()  # bot position
+        if not self.position:
+            raise InvalidTarget()
+        pos_y, pos_x = self.position  # bot position
+        world = self.world
+
+        if 0 < pos_y < len(world) - 1 and 0 < pos_x < len(world[0]) - 1:
+            cells = [world[pos_y + y][pos_x + x] for y, x in VIEW_OFFSETS[self.facing]]
+        else:
+            # on the edge, as after escaping, index the turned state and wrap around as rotating the maze did
+            state, (pos_y, pos_x) = self.state, self.to_state(pos_y, pos_x)
+            cells = [state[pos_y + y][pos_x + x] for y in (-1, 0, 1) for x in (-1, 0, 1)]
+        cells[4] = '-'
+
+        return '\n'.join(''.join(cells[start:start + 3]) for start in (0, 3, 6))
+
+    def to_state(self, y, x):
+        """World coord as the bot sees it"""
 
-        data = [
-            [self.state[pos_y - 1][pos_x - 1], self.state[pos_y - 1][pos_x + 0], self.state[pos_y - 1][pos_x + 1]],
-            [self.state[pos_y - 0][pos_x - 1], '-', self.state[pos_y - 0][pos_x + 1]],
-            [self.state[pos_y + 1][pos_x - 1], self.state[pos_y + 1][pos_x + 0], self.state[pos_y + 1][pos_x + 1]],
-        ]
-        return self.to_string(data)
+        height, width = len(self.world), len(self.world[0])
+        return ((y, x), (width - 1 - x, y), (height - 1 - y, width - 1 - x), (x, height - 1 - y))[self.facing]
+
+    def to_world(self, y, x):
+        """Coord the bot sees, in the world"""
+
+        height, width = len(self.world), len(self.world[0])
+        return ((y, x), (x, width - 1 - y), (height - 1 - y, width - 1 - x), (height - 1 - x, y))[self.facing]
 
     def __str__(self):
         return self.to_string(self.state)
@@ -138,8 +210,8 @@ class GameWon(Exception):
 
 
 @contextmanager
-def temp_dir(copy_targets=None):
-    """Create temp directory context"""
+def temp_dir(copy_targets=None, book=None):
+    """Create temp directory context, with the opening book under the name the bot reads it by"""
 
     copy_targets = copy_targets or []
 
@@ -151,15 +223,20 @@ def temp_dir(copy_targets=None):
     for target in copy_targets:
         filename = os.path.basename(target)
         shutil.copy(target, tmpdir(filename))
+    if book and os.path.isfile(book):
+        shutil.copy(book, tmpdir(BOOK_NAME))
 
     # cd temp directory
+    cwd = os.getcwd()
     os.chdir(tmpdir())
 
-    # yield context handle
-    yield tmpdir
-
-    # remove temp directory
-    shutil.rmtree(tmpdir())
+    try:
+        # yield context handle
+        yield tmpdir
+    finally:
+        # cd back, remove temp directory
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir())
 
 
 @contextmanager
@@ -189,6 +266,245 @@ def run(command, stdin):
     return stdin, stdout.rstrip(), stderr.rstrip()
 
 
+def load_bot(target):
+    """Import target as a module, None if it has no in process Session"""
+
+    try:
+        spec = importlib.util.spec_from_file_location('maze_escape_bot', target)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except (ImportError, OSError, SyntaxError):
+        return None
+
+    return module if hasattr(module, 'Session') else None
+
+
+def subprocess_bot(command):
+    """Next move callable running command once per move"""
+
+    def next_move(stdin):
+        _, stdout, stderr = run(command, stdin)
+        return stdout, stderr
+
+    return next_move
+
+
+def in_process_bot(module, master, stats=False):
+    """Next move callable playing one game through the bot's Session, reporting its STATS when asked"""
+
+    session = module.Session(master)
+    stats = stats and hasattr(module, 'STATS')
+    if stats:
+        module.STATS.enabled = True
+
+    def next_move(stdin):
+        # collect debug output and crashes like a subprocess would
+        with redirect_stderr(StringIO()) as stderr:
+            try:
+                stdout = session.turn(stdin)
+            except Exception:
+                stdout = ''
+                traceback.print_exc()
+
+            if stats:
+                module.STATS.dump(sys.stderr)
+
+        return stdout, stderr.getvalue().rstrip()
+
+    return next_move
+
+
+class Worker(object):
+    """Long lived bot process, speaking main.serve's line-delimited JSON protocol"""
+
+    def __init__(self, command, timeout=TIMEOUT):
+        self.command = tuple(command) + ('--worker',)
+        self.timeout = timeout
+        self.handle = None
+        self.generation = 0
+        self.games = 0
+
+    def start(self):
+        """Start a fresh worker process"""
+
+        self.handle = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, universal_newlines=True, bufsize=1)
+        self.generation += 1
+
+        # read both pipes in the background, so a silent or chatty worker can't block the harness
+        self.lines, self.errors = Queue(), Queue()
+        for stream, queue in ((self.handle.stdout, self.lines), (self.handle.stderr, self.errors)):
+            threading.Thread(target=self.pump, args=(stream, queue), daemon=True).start()
+
+    @staticmethod
+    def pump(stream, queue):
+        for line in iter(stream.readline, ''):
+            queue.put(line)
+        queue.put(None)
+
+    def ensure(self):
+        """Start the worker unless it is running"""
+
+        if self.handle is None or self.handle.poll() is not None:
+            self.start()
+
+    def request(self, message):
+        """Send a request, return its response or an error once the worker times out or dies"""
+
+        self.ensure()
+
+        try:
+            self.handle.stdin.write(json.dumps(message) + '\n')
+            self.handle.stdin.flush()
+            line = self.lines.get(timeout=self.timeout)
+        except Empty:
+            line, error = None, 'Worker timed out after %ss' % self.timeout
+        except OSError as e:
+            line, error = None, 'Worker crashed: %s' % e
+        else:
+            error = 'Worker crashed'
+
+        if line is None:
+            # drop the worker, the next request starts a fresh one
+            self.close()
+            return {'game': message.get('game'), 'error': error}
+
+        try:
+            response = json.loads(line)
+        except ValueError:
+            response = None
+
+        if not isinstance(response, dict) or response.get('game') != message.get('game'):
+            # out of step with the worker, its next line could answer anything
+            self.close()
+            return {'game': message.get('game'), 'error': 'Worker sent %r' % line.rstrip()}
+
+        return response
+
+    def stderr(self):
+        """Collect what the worker wrote to stderr so far"""
+
+        lines = []
+        while True:
+            try:
+                line = self.errors.get_nowait()
+            except Empty:
+                break
+            if line is not None:
+                lines.append(line)
+
+        return ''.join(lines).rstrip()
+
+    def bot(self, master):
+        """Next move callable playing a new game on this worker, its end() frees the game once it is over"""
+
+        self.games += 1
+        game = self.games
+        sent = {}
+
+        def next_move(stdin):
+            request = {'game': game, 'input': stdin}
+
+            # a restarted worker has lost the game, tell it the master again
+            self.ensure()
+            if sent.get('generation') != self.generation:
+                request['master'] = master
+                sent['generation'] = self.generation
+            response = self.request(request)
+
+            # stats come back with the response, pass them on as a process would report them
+            stats = json.dumps({'stats': response['stats']}, sort_keys=True) if 'stats' in response else ''
+
+            stderr = '\n'.join(filter(None, (self.stderr(), response.get('error', '').rstrip(), stats)))
+            return response.get('move', ''), stderr
+
+        def end():
+            # a worker restarted since the game's last move never had it
+            if self.handle is not None and self.handle.poll() is None and sent.get('generation') == self.generation:
+                self.request({'game': game, 'end': True})
+
+        next_move.end = end
+        return next_move
+
+    def close(self):
+        """Stop the worker process"""
+
+        if self.handle is not None:
+            self.handle.kill()
+            self.handle.wait()
+            for stream in (self.handle.stdin, self.handle.stdout, self.handle.stderr):
+                stream.close()
+            self.handle = None
+
+
+def play(board, next_move, max_moves=MAX_MOVES, report=None):
+    """Play a game, return details about each move, the outcome and an error message"""
+
+    moves = []
+
+    try:
+        for move in range(max_moves):
+            stdin = '1\n%s' % board.view()
+            stdout, stderr = next_move(stdin)
+            stats, stderr = split_stats(stderr)
+
+            # collect details about move
+            moves.append({
+                'move': move,
+                'stdin': stdin,
+                'stdout': stdout,
+                'stderr': stderr,
+            })
+            if stats is not None:
+                moves[-1]['stats'] = stats
+
+            try:
+                # update boards state
+                board.move(stdout)
+            except GameWon:
+                return moves, WON, None
+            except InvalidTarget as e:
+                return moves, LOST, str(e)
+            finally:
+                if report:
+                    report(moves[-1])
+
+        return moves, UNFINISHED, None
+    finally:
+        # let a bot that keeps games between moves free this one
+        end = getattr(next_move, 'end', None)
+        if end:
+            end()
+
+
+def split_stats(stderr):
+    """Take the bot's stats report, a {"stats": ...} JSON line, out of its stderr"""
+
+    stats, lines = None, []
+
+    for line in stderr.splitlines():
+        if line.startswith(STATS_PREFIX):
+            stats = json.loads(line)['stats']
+        else:
+            lines.append(line)
+
+    return stats, '\n'.join(lines)
+
+
+def report(move):
+    """Print details about a move"""
+
+    print()
+    if move['stderr']:
+        print('STDERR')
+        print(move['stderr'])
+    if move.get('stats'):
+        print('STATS')
+        print(json.dumps(move['stats'], sort_keys=True))
+    print('STDIN    STDOUT', move['stdout'])
+    print(move['stdin'])
+
+
 def create_parser():
     """Create an argument parser"""
 
@@ -197,10 +513,20 @@ def create_parser():
                         help='Executable to run code (%s)' % os.path.basename(EXECUTABLE))
     parser.add_argument('-f', '--file', default=TARGET, dest='target',
                         help='File for executable to call (%s)' % os.path.basename(TARGET))
-    parser.add_argument('-o', '--out', default=MOVES, dest='moves', type=FileType('w'),
-                        help='File to dump moves (%s)' % os.path.basename(MOVES))
+    parser.add_argument('-o', '--out', default=MOVES, dest='moves',
+                        help='JSON lines log of each move, gzip or zstd compressed by a .gz or .zst extension '
+                             '(%s)' % os.path.basename(MOVES))
     parser.add_argument('-m', '--max', default=MAX_MOVES, type=int, dest='max_moves',
                         help='Max number of moves (%d)' % MAX_MOVES)
+    parser.add_argument('-b', '--book', default=BOOK,
+                        help='Opening book to give the bot, when it exists (%s)' % os.path.basename(BOOK))
+    parser.add_argument('--engine', default=ENGINE, choices=('auto', 'process', 'worker', 'subprocess'),
+                        help='Import the bot and play in process, talk to one long lived worker process, '
+                             'or run it per move (%s)' % ENGINE)
+    parser.add_argument('-t', '--timeout', default=TIMEOUT, type=float,
+                        help='Seconds a worker has per move (%s)' % TIMEOUT)
+    parser.add_argument('--stats', action='store_true',
+                        help="Have the bot time its phases and count its work, logged with each move")
 
     return parser.parse_args()
 
@@ -219,44 +545,44 @@ def main():
         #######
     """)[1:-1])
 
-    # collect moves
-    moves = []
+    # in world orientation, as the bot knows it
+    master = str(board).replace('b', '-')
 
-    with temp_dir(copy_targets=[args.target]) as tmpdir:
-        command = args.executable, tmpdir(args.target)  # ("python", "main.py")
+    # log each move as it is played
+    log = open_log(args.moves, 'w')
 
-        for move in range(args.max_moves):
-            # run command
-            stdin, stdout, stderr = run(command, '1\n%s' % board.view())
+    def log_move(move):
+        report(move)
+        write_log(log, move)
 
-            try:
-                # update boards state
-                board.move(stdout)
-            except GameWon:
-                break
-            except InvalidTarget as e:
-                print(e)
-                break
-            finally:
-                # print details about move
-                print()
-                if stderr:
-                    print('STDERR')
-                    print(stderr)
-                print('STDIN    STDOUT', stdout)
-                print(stdin)
-
-                # collect details about move
-                moves.append({
-                    'move': move,
-                    'stdin': stdin,
-                    'stdout': stdout,
-                    'stderr': stderr,
-                })
-
-    # dump details about move to file
-    with closing(args.moves) as f:
-        json.dump(moves, f, sort_keys=True, indent=2)
+    copy_targets = [args.target] if os.path.isfile(args.target) else []
+
+    with closing(log), temp_dir(copy_targets=copy_targets, book=args.book) as tmpdir:
+        next_move = worker = None
+        command = (args.executable, tmpdir(args.target)) + (('--stats',) if args.stats else ())
+
+        if args.engine == 'worker':
+            worker = Worker(command, timeout=args.timeout)
+            next_move = worker.bot(master)
+
+        if args.engine in ('auto', 'process') and args.executable == EXECUTABLE:
+            bot = load_bot(tmpdir(args.target))
+            next_move = bot and in_process_bot(bot, master, args.stats)
+
+        if args.engine == 'process' and not next_move:
+            sys.exit('%s has no Session to run in process' % args.target)
+
+        if not next_move:
+            next_move = subprocess_bot(command)  # ("python", "main.py")
+
+        moves, outcome, message = play(board, next_move, args.max_moves, report=log_move)
+        write_log(log, {'outcome': outcome, 'message': message, 'moves': len(moves)})
+
+        if worker:
+            worker.close()
+
+    if message:
+        print(message)
 
 
 if __name__ == '__main__':
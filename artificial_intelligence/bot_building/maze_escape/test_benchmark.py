@@ -0,0 +1,95 @@
+# coding=utf-8
+# Timing for the bot's hot paths, at growing maze sizes. Needs pytest-benchmark.
+#
+# Save a baseline, then fail the run when a later change regresses against it:
+#
+#   py.test test_benchmark.py --benchmark-autosave
+#   py.test test_benchmark.py --benchmark-compare --benchmark-compare-fail=mean:15%
+import pytest
+
+from .generate import generate
+from .main import Board, Bot, ViewCache
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = [7, 31, 127]
+
+
+# FIXTURES
+# ============================================================================
+@pytest.fixture(params=SIZES, ids=lambda size: '%dx%d' % (size, size))
+def master(request):
+    return generate(request.param, request.param, seed=request.param)
+
+
+@pytest.fixture
+def board(master):
+    """Master with the bot on the open cell closest to the middle"""
+
+    rows = [list(row) for row in master.split('\n')]
+    middle = len(rows) // 2, len(rows[0]) // 2
+
+    y, x = min(((y, x) for y, row in enumerate(rows) for x, char in enumerate(row) if char == '-'),
+               key=lambda cell: abs(cell[0] - middle[0]) + abs(cell[1] - middle[1]))
+    rows[y][x] = 'b'
+
+    return '\n'.join(''.join(row) for row in rows)
+
+
+@pytest.fixture
+def view(board):
+    """The bot's first view, around it"""
+
+    rows = board.split('\n')
+    y, x = next((y, row.index('b')) for y, row in enumerate(rows) if 'b' in row)
+
+    return '\n'.join(row[x - 1:x + 2] for row in rows[y - 1:y + 2])
+
+
+# Board
+# ============================================================================
+def test_board_from_str(benchmark, board):
+    benchmark(Board.from_str, board)
+
+
+@pytest.mark.parametrize('direction', ['RIGHT', 'DOWN'])
+def test_board_rotate(benchmark, board, direction):
+    benchmark(Board.rotate, board, direction)
+
+
+def test_board_fork(benchmark, board):
+    benchmark(Board.from_str(board).fork)
+
+
+def test_board_merge(benchmark, board, view):
+    def setup():
+        return (Board.from_str(board), Board.from_str(view)), {}
+
+    benchmark.pedantic(Board.merge, setup=setup, rounds=20)
+
+
+# Bot
+# ============================================================================
+def test_bot_find_path(benchmark, board):
+    bot = Bot(Board.from_str(board))
+
+    assert benchmark(bot.find_path, 'e')
+
+
+def test_bot_find_position(benchmark, master, view):
+    bot = Bot(Board.from_str(view))
+
+    benchmark(bot.find_position, master)
+
+
+def test_bot_simulate_all_moves(benchmark, master, view):
+    positions = str(Bot(Board.from_str(view)).find_position(master))
+
+    # a cold cache each round, so every view is simulated
+    assert benchmark(lambda: Bot.simulate_all_moves(positions, master, views=ViewCache()))
+
+
+def test_bot_next_move(benchmark, master, view):
+    bot = Bot(Board.from_str(view))
+
+    assert benchmark(bot.next_move, master) in ('UP', 'RIGHT', 'DOWN', 'LEFT')
@@ -0,0 +1,34 @@
+# coding=utf-8
+from textwrap import dedent
+
+from . import main, run
+from .book import simulate
+
+MAZE = dedent("""
+    #####
+    #--##
+    #-#-e
+    #---#
+    #####
+""")[1:-1]
+
+
+# simulate
+# ============================================================================
+def test_simulate_books_the_searched_moves(tmpdir):
+    book = main.OpeningBook(main.Board.from_str(MAZE))
+    starts = [(y, x) for y, row in enumerate(MAZE.split('\n')) for x, char in enumerate(row) if char == '-']
+
+    with tmpdir.as_cwd():
+        simulate(main, MAZE, book)
+        assert len(book)
+
+        # every game played on the booked moves alone, without searching
+        for y, x in starts:
+            for facing in ('UP', 'RIGHT', 'DOWN', 'LEFT'):
+                board = run.Board(MAZE[:y * 6 + x] + 'b' + MAZE[y * 6 + x + 1:], facing)
+                session = main.Session(MAZE, book=book)
+                session.search = None
+
+                _, outcome, _ = run.play(board, lambda stdin: (session.turn(stdin), ''))
+                assert outcome == run.WON
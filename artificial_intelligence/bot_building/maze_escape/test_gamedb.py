@@ -0,0 +1,107 @@
+# coding=utf-8
+import json
+from contextlib import closing
+
+import pytest
+
+from .gamedb import connect, ingest, find_game, view_stats, find_outcome, outcome, ESCAPED, CRASHED, MOVED, INVALID
+from .gamelog import open_log, write_log
+
+LOGGED = [
+    {'move': 0, 'stdin': '1\n#--\n#b-\n#--', 'stdout': 'RIGHT', 'stderr': ''},
+    {'move': 1, 'stdin': '1\n###\n-b-\n---', 'stdout': 'UP', 'stderr': ''},
+    {'outcome': 'lost', 'message': 'Cannot move into #', 'moves': 2},
+    {'move': 0, 'stdin': '1\n-e-\n-b-\n---', 'stdout': 'UP', 'stderr': ''},
+    {'outcome': 'won', 'message': None, 'moves': 1},
+]
+
+RECORDED = [{
+    'id': 42,
+    'inputs': json.dumps({'payload': ['1\n#--\n#b-\n#--', '2\n---\n---\n###', '1\n-e-\n---\n---']}),
+    'outputs': json.dumps({'payload': ['RIGHT\n', 'SIDEWAYS\n', 'UP\n']}),
+    'player-1': 'one',
+    'player-2': 'two',
+}]
+
+
+# FIXTURES
+# ============================================================================
+@pytest.fixture
+def db():
+    with closing(connect(':memory:')) as db:
+        yield db
+
+
+@pytest.fixture
+def sources(tmpdir):
+    log, archive = str(tmpdir.join('moves.jsonl.gz')), str(tmpdir.join('allmoves.json'))
+
+    with open_log(log, 'w') as f:
+        for record in LOGGED:
+            write_log(f, record)
+    with open(archive, 'w') as f:
+        json.dump(RECORDED, f)
+
+    return log, archive
+
+
+# outcome
+# ============================================================================
+@pytest.mark.parametrize('view, direction, expected', [
+    ('-e-\n---\n---', 'UP', ESCAPED),
+    ('###\n---\n---', 'UP', CRASHED),
+    ('###\n---\n---', 'LEFT', MOVED),
+    ('###\n---\n---', 'SIDEWAYS', INVALID),
+])
+def test_outcome(view, direction, expected):
+    assert outcome(view, direction) == expected
+
+
+# build
+# ============================================================================
+def test_ingest_logs_and_archives(db, sources):
+    log, archive = sources
+
+    assert ingest(db, log) == 2
+    assert ingest(db, archive) == 1
+
+    games = db.execute('SELECT id, player1, player2, moves, winner FROM games ORDER BY game').fetchall()
+    assert games == [(None, None, None, 2, None), (None, None, None, 1, 1), (42, 'one', 'two', 3, 1)]
+
+
+def test_ingest_twice_replaces_games(db, sources):
+    for source in sources + sources:
+        ingest(db, source)
+
+    assert db.execute('SELECT COUNT(*) FROM games').fetchone() == (3,)
+    assert db.execute('SELECT COUNT(*) FROM moves').fetchone() == (6,)
+
+
+# queries
+# ============================================================================
+def test_find_game(db, sources):
+    ingest(db, sources[1])
+
+    assert list(find_game(db, 42)) == [
+        (0, 1, '#--\n#b-\n#--', 'RIGHT', MOVED),
+        (1, 2, '---\n---\n###', 'SIDEWAYS', INVALID),
+        (2, 1, '-e-\n---\n---', 'UP', ESCAPED),
+    ]
+    assert list(find_game(db, 7)) == []
+
+
+def test_view_stats(db, sources):
+    for source in sources:
+        ingest(db, source)
+
+    assert sorted(view_stats(db, '#--\n#?-\n#--')) == [('RIGHT', MOVED, 2)]
+    assert sorted(view_stats(db, '?e?\n???\n???')) == [('UP', ESCAPED, 2)]
+
+
+def test_find_outcome(db, sources):
+    for source in sources:
+        ingest(db, source)
+
+    assert list(find_outcome(db, ESCAPED)) == [(42, 2, 1, '-e-\n---\n---', 'UP'), (None, 0, 1, '-e-\n-b-\n---', 'UP')]
+    assert list(find_outcome(db, ESCAPED, limit=1)) == [(42, 2, 1, '-e-\n---\n---', 'UP')]
+    assert list(find_outcome(db, CRASHED)) == [(None, 1, 1, '###\n-b-\n---', 'UP')]
@@ -0,0 +1,119 @@
+# coding=utf-8
+import json
+from io import StringIO
+
+import pytest
+
+from . import gamelog
+from .convert import convert, unescape
+from .gamelog import open_log, read_log, write_log, iter_array
+from .replay import replay
+
+MOVES = [
+    {'move': 0, 'stdin': '1\n#--\n#b-\n#--', 'stdout': 'RIGHT', 'stderr': ''},
+    {'move': 1, 'stdin': '1\n###\n-b-\n---', 'stdout': 'LEFT', 'stderr': 'thinking'},
+    {'outcome': 'won', 'message': None, 'moves': 2},
+]
+
+
+# FIXTURES
+# ============================================================================
+@pytest.fixture(params=['moves.jsonl', 'moves.jsonl.gz'])
+def log(request, tmpdir):
+    path = str(tmpdir.join(request.param))
+
+    with open_log(path, 'w') as f:
+        for record in MOVES:
+            write_log(f, record)
+
+    return path
+
+
+# gamelog
+# ============================================================================
+def test_read_log_round_trip(log):
+    with open_log(log) as f:
+        assert list(read_log(f)) == MOVES
+
+
+def test_read_log_skips_to_start(log):
+    with open_log(log) as f:
+        assert list(read_log(f, start=1)) == MOVES[1:]
+
+
+def test_read_log_reads_old_json_arrays(tmpdir):
+    path = str(tmpdir.join('allmoves.json'))
+    with open(path, 'w') as f:
+        json.dump(MOVES, f, indent=2)
+
+    with open_log(path) as f:
+        assert list(read_log(f)) == MOVES
+    with open_log(path) as f:
+        assert list(read_log(f, start=2)) == MOVES[2:]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1 << 16])
+@pytest.mark.parametrize('array, expected', [
+    ('1,12345, 678]', [1, 12345, 678]),
+    (' {"a": "x, y"} ,\n[1, 2], -1.5e3 ]', [{'a': 'x, y'}, [1, 2], -1500.0]),
+    ('"]", true]', [']', True]),
+    (']', []),
+    ('123', [123]),
+])
+def test_iter_array_across_chunks(monkeypatch, chunk_size, array, expected):
+    monkeypatch.setattr(gamelog, 'CHUNK_SIZE', chunk_size)
+
+    assert list(iter_array(StringIO(array))) == expected
+
+
+def test_iter_array_raises_on_truncated_records(monkeypatch):
+    monkeypatch.setattr(gamelog, 'CHUNK_SIZE', 4)
+
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array(StringIO('{"move": 1}, {"mo')))
+
+
+def test_open_log_needs_zstandard_for_zst(tmpdir):
+    if gamelog.zstandard is not None:
+        pytest.skip('zstandard is installed')
+
+    with pytest.raises(ValueError):
+        open_log(str(tmpdir.join('moves.jsonl.zst')))
+
+
+# convert
+# ============================================================================
+def test_unescape_decodes_nested_json():
+    game = {'id': 1, 'inputs': '{"payload": ["1\\n---"]}', 'player-1': 'bot'}
+
+    assert unescape(game) == {'id': 1, 'inputs': {'payload': ['1\n---']}, 'player-1': 'bot'}
+
+
+def test_convert_round_trip(tmpdir):
+    games = [{'id': game, 'outputs': json.dumps({'payload': ['UP\n', 'LEFT\n']})} for game in range(3)]
+    source, dump = str(tmpdir.join('allmoves.json')), str(tmpdir.join('allmoves-fixed.jsonl.gz'))
+    with open(source, 'w') as f:
+        json.dump(games, f)
+
+    assert convert(source, dump) == 3
+    with open_log(dump) as f:
+        assert list(read_log(f)) == [{'id': game, 'outputs': {'payload': ['UP\n', 'LEFT\n']}} for game in range(3)]
+
+
+# replay
+# ============================================================================
+def test_replay_prints_moves_and_outcome(log, capsys):
+    replay(log, delay=0)
+    out = capsys.readouterr().out
+
+    assert ' MOVE 0 ' in out and ' MOVE 1 ' in out
+    assert 'STDERR\nthinking' in out
+    assert ' WON IN 2 MOVES ' in out
+
+
+def test_replay_starts_from_a_move(log, capsys):
+    replay(log, start=1, delay=0)
+    out = capsys.readouterr().out
+
+    assert ' MOVE 0 ' not in out
+    assert 'STDOUT\nLEFT' in out
@@ -0,0 +1,56 @@
+# coding=utf-8
+import pytest
+
+from .generate import ALGORITHMS, MIN_SIZE, generate
+
+
+def reachable(maze, start='e'):
+    """Cells reachable from start over open cells, by flood fill"""
+
+    rows = maze.split('\n')
+    y, x = next((y, row.index(start)) for y, row in enumerate(rows) if start in row)
+    seen = {(y, x)}
+    stack = [(y, x)]
+
+    while stack:
+        y, x = stack.pop()
+        for dy, dx in ((-1, 0), (0, 1), (1, 0), (0, -1)):
+            cell = y + dy, x + dx
+            if 0 <= cell[0] < len(rows) and 0 <= cell[1] < len(rows[0]) and cell not in seen \
+                    and rows[cell[0]][cell[1]] in '-b':
+                seen.add(cell)
+                stack.append(cell)
+
+    return seen
+
+
+# generate
+# ============================================================================
+@pytest.mark.parametrize('algorithm', sorted(ALGORITHMS))
+@pytest.mark.parametrize('height, width', [(MIN_SIZE, MIN_SIZE), (7, 7), (15, 21), (40, 31)])
+@pytest.mark.parametrize('seed', range(4))
+def test_generate_reaches_every_open_cell_from_the_exit(algorithm, height, width, seed):
+    maze = generate(height, width, algorithm, seed, bot=True)
+    rows = maze.split('\n')
+
+    assert (len(rows), len(rows[0])) == (height, width)
+    assert set(len(row) for row in rows) == {width}
+    assert maze.count('e') == 1 and maze.count('b') == 1
+
+    border = rows[0] + rows[-1] + ''.join(row[0] + row[-1] for row in rows)
+    assert 'e' in border
+
+    open_cells = {(y, x) for y, row in enumerate(rows) for x, char in enumerate(row) if char in '-be'}
+    assert len(open_cells) > 2
+    assert reachable(maze) == open_cells
+
+
+def test_generate_is_seeded():
+    assert generate(15, 15, seed=3) == generate(15, 15, seed=3)
+    assert generate(15, 15, seed=3) != generate(15, 15, seed=4)
+
+
+@pytest.mark.parametrize('height, width', [(MIN_SIZE - 1, 7), (7, 2001)])
+def test_generate_rejects_sizes_out_of_range(height, width):
+    with pytest.raises(ValueError):
+        generate(height, width)
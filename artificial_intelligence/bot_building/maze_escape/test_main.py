@@ -1,11 +1,16 @@
 # coding=utf-8
-from io import StringIO
+import json
+import os
+from io import BytesIO, StringIO
 from itertools import chain
 from textwrap import dedent
 
 import pytest
 
-from .main import Board, Dimensions, Cell, Coord, Delta, InvalidTarget, Bot, Cartesian
+from . import main
+from .main import Board, Dimensions, Cell, Coord, Delta, InvalidTarget, Bot, Cartesian, bfs, astar, bidirectional, \
+    TemplateMatcher, Belief, ViewCache, MazeStore, OpeningBook, distance_field, canonical_view, UNREACHABLE, \
+    Session, TextStateStore, PackedStateStore, Stats, STATS, serve, next_moves
 
 
 # FIXTURES
@@ -56,6 +61,11 @@ def test_board_state_property(board1):
     ]
 
 
+def test_board_stores_flat_grid(board1):
+    assert board1.grid == bytearray(b'#####' b'#---#' b'#-b-#' b'e---#' b'#####')
+    assert (board1.height, board1.width) == (5, 5)
+
+
 # Board.from_state
 # ============================================================================
 def test_board_from_state(board1):
@@ -134,6 +144,13 @@ def test_board_dimensions(board1):
     assert board1.dimensions == Dimensions(5, 5)
 
 
+def test_board_dimensions_are_kept_until_the_board_grows(board1):
+    assert board1.dimensions is board1.dimensions
+
+    board1.pad(['UP'])
+    assert board1.dimensions == Dimensions(6, 5)
+
+
 # Board.iter
 # ============================================================================
 def test_board_iter(board1):
@@ -180,6 +197,36 @@ def test_board_find_cell_by_delta_raises(board1):
         board1.find(Delta(-1, -1))
 
 
+def test_board_find_cell_by_label(board1):
+    board1.set(Coord(1, 1), 'b UP')
+
+    assert board1.find('b UP') == Cell(1, 1, 'b UP')
+    assert str(board1).split('\n')[1] == '#b UP--#'
+
+
+def test_board_find_keeps_index_current(board1):
+    assert board1.find('b') == Cell(2, 2, 'b')
+
+    board1.move('b', Delta(-1, 0))
+    assert board1.index[ord('b')] == {7}
+
+    board1.pad(['UP', 'LEFT'])
+    assert board1.index[ord('b')] == {15}
+    assert board1.find('b') == Cell(2, 3, 'b')
+
+
+def test_board_find_remembers_symbols_too_common_to_index():
+    board = Board.from_str('\n'.join(['-' * 10] * 10))
+
+    assert board.find('-') == Cell(0, 0, '-')
+    assert ord('-') not in board.index
+    assert ord('-') in board._unindexed
+
+    board.set(Coord(0, 0), '#')
+    assert board.find('-') == Cell(0, 1, '-')
+    assert board.fork()._unindexed == {ord('-')}
+
+
 # Board.filter
 # ============================================================================
 def test_board_filter(board1):
@@ -230,6 +277,20 @@ def test_board_fork(board1):
     assert board1.find(coord).value == 'b'
 
 
+def test_board_fork_shares_grid_until_written(board1):
+    board2 = board1.fork()
+    assert board2._grid is board1._grid
+
+    board2.set(Coord(1, 1), 'm')
+    assert board2._diff == {6: ord('m')}
+    assert str(board1).split('\n')[1] == '#---#'
+    assert str(board2).split('\n')[1] == '#m--#'
+
+    board1.set(Coord(1, 2), 'n')
+    assert board2.find(Coord(1, 2)).value == '-'
+    assert board1.grid is not board2.grid
+
+
 # Bot.move
 # ============================================================================
 def test_bot_move(board1):
@@ -257,6 +318,16 @@ def test_board_str_shows_board(board2):
     assert str(board2) == grid
 
 
+def test_board_str_folds_a_forks_changes(board1):
+    fork = board1.fork()
+    fork.set(Coord(1, 1), '^')
+
+    assert fork._diff
+    assert str(fork).split('\n')[1] == '#^--#'
+    assert fork._diff is None
+    assert str(board1).split('\n')[1] == '#---#'
+
+
 # Board.pad
 # ============================================================================
 
@@ -384,6 +455,20 @@ def test_board_pad_left(directions, cell, expected):
     assert board.find('b') == cell
 
 
+def test_board_pad_rows_in_place_leaves_forks_alone(board1):
+    original = str(board1)
+    fork = board1.fork()
+    board1.grid  # fold, so board1 grows its own buffer in place
+
+    board1.pad(['UP', 'DOWN', 'DOWN'])
+    fork.pad(['DOWN'])
+
+    assert str(board1) == '\n'.join(['ooooo', original, 'ooooo', 'ooooo'])
+    assert str(fork) == '\n'.join([original, 'ooooo'])
+    assert board1.find('b') == Cell(3, 2, 'b')
+    assert board1.find('e') == Cell(4, 0, 'e')
+
+
 # Board.rotate
 # ============================================================================
 @pytest.mark.parametrize('direction, undo, expected', [
@@ -517,6 +602,23 @@ def test_board_rotate_rectangle(direction, expected):
     assert Board.rotate(state, direction) == expected
 
 
+@pytest.mark.parametrize('direction', ['UP', 'RIGHT', 'DOWN', 'LEFT'])
+def test_board_rotated_matches_rotate(direction):
+    state = dedent("""
+        ab^d
+        efgh
+        ij<l
+    """)[1:-1]
+    board = Board.from_str(state)
+    board.set(Coord(1, 2), 'b UP')
+
+    rotated = board.rotated(direction)
+    rotated_back = rotated.rotated(direction, undo=True)
+
+    assert str(rotated).replace('b UP', 'g') == Board.rotate(state, direction)
+    assert str(rotated_back) == str(board)
+
+
 # Bot.ini
 # ============================================================================
 def test_bot_initializes_with_position_and_uid(board1):
@@ -649,6 +751,33 @@ def test_bot_find_path_returns_empty_list():
     assert bot.find_path('e') == []
 
 
+def test_bot_find_path_unreachable_target_returns_empty_list():
+    grid = dedent("""
+        #######
+        #--#--#
+        #--#-b#
+        #--#--#
+        #######
+        e-----#
+        #######
+    """)[1:-1]
+
+    board = Board.from_str(grid)
+    bot = Bot(board)
+    assert bot.find_path('e') == []
+
+
+@pytest.mark.parametrize('search', [bfs, astar, bidirectional])
+def test_bot_find_path_with_search(board2, search):
+    bot = Bot(board2)
+    path = bot.find_path('e', search=search)
+
+    assert len(path) == 7
+    for direction in path:
+        bot.move(direction)
+    assert bot.cell == Cell(4, 0, 'b')
+
+
 # Bot.find_position
 # ============================================================================
 @pytest.mark.parametrize('state, expected', [
@@ -764,6 +893,123 @@ def test_bot_find_position(state, expected):
     assert str(positions) == expected
 
 
+# TemplateMatcher.match
+# ============================================================================
+@pytest.mark.parametrize('pattern, anchor, expected', [
+    ('#b', Coord(0, 1), [Coord(1, 1), Coord(1, 4), Coord(2, 1), Coord(2, 4), Coord(3, 1), Coord(3, 4), Coord(5, 1)]),
+    ('ooo\n#b#', Coord(1, 1), []),
+    ('b-\n##', Coord(0, 0), [Coord(5, 1), Coord(5, 2), Coord(5, 3), Coord(5, 4)]),
+    ('#o\n#b\ne-', Coord(1, 1), [Coord(3, 1)]),
+])
+def test_template_matcher_match(pattern, anchor, expected):
+    master = dedent("""
+        #######
+        #--#--#
+        #--#--#
+        #--#--#
+        e-----#
+        #-----#
+        #######
+    """)[1:-1]
+    matcher = TemplateMatcher(Board.from_str(master))
+
+    assert matcher.match(Board.from_str(pattern), anchor) == expected
+
+
+# Belief
+# ============================================================================
+@pytest.fixture
+def master():
+    grid = dedent("""
+        #######
+        #--#--#
+        #--#--#
+        #--#--#
+        e-----#
+        #-----#
+        #######
+    """)[1:-1]
+
+    return Board.from_str(grid)
+
+
+def test_belief_from_board_draws_positions(master):
+    board = Board.from_input('2\n#--\n#--\n#--')
+    belief = Belief.from_board(master, board)
+
+    assert str(belief.positions()) == dedent("""
+        #######
+        #--#--#
+        #^v#^v#
+        #--#-v#
+        e----v#
+        #-<<<-#
+        #######
+    """)[1:-1]
+
+
+def test_belief_move_and_observe(master):
+    belief = Belief.from_board(master, Board.from_input('2\n#--\n#--\n#--'))
+
+    belief.move('RIGHT')
+    belief.observe('###\n-b-\n---')
+
+    assert str(belief.positions()) == dedent("""
+        #######
+        #--#--#
+        #<>#<>#
+        #--#--#
+        e-----#
+        #-----#
+        #######
+    """)[1:-1]
+
+
+def test_belief_dump_and_load(master):
+    belief = Belief.from_board(master, Board.from_input('2\n#--\n#--\n#--'))
+
+    with BytesIO() as f:
+        belief.dump(f)
+        f.seek(0)
+        loaded = Belief.load(f, master)
+
+    assert loaded.hypotheses == belief.hypotheses
+
+    with BytesIO() as f:
+        belief.dump(f)
+        f.seek(0)
+        assert Belief.load(f, Board.from_str('###\n#-#\n###')) is None
+
+
+# MazeStore
+# ============================================================================
+def test_distance_field(master):
+    distances = distance_field(master)
+
+    assert distances[4 * 7:5 * 7].tolist() == [0, 1, 2, 3, 4, 5, UNREACHABLE]
+    assert distances[1 * 7 + 5] == 8
+
+
+def test_maze_store_builds_once_and_reads_back(master, tmpdir):
+    store = MazeStore(str(master), directory=str(tmpdir))
+
+    assert store.distances == tuple(distance_field(master))
+    assert tmpdir.listdir() == [tmpdir.join(os.path.basename(store.filename))]
+
+    view = '#--\n#b-\n#--'
+    reloaded = MazeStore(str(master), directory=str(tmpdir))
+    assert reloaded.positions(view) == Belief.from_board(master, Board.from_str(view)).hypotheses
+    assert reloaded.positions('eee\neee\neee') == set()
+
+
+def test_maze_store_rebuilds_older_formats(master, tmpdir):
+    store = MazeStore(str(master), directory=str(tmpdir))
+    with open(store.filename, 'wb') as f:
+        f.write(b'MZS2' + bytes(64))
+
+    assert store.distances == tuple(distance_field(master))
+
+
 # Bot.simulate_move
 # ============================================================================
 @pytest.mark.parametrize('coord, direction, expected', [
@@ -846,6 +1092,62 @@ def test_bot_simulate_all_moves():
     assert Bot.simulate_all_moves(positions, master) == expected
 
 
+def test_bot_simulate_all_moves_uses_view_cache():
+    master = dedent("""
+        #######
+        #--#--#
+        #--#--#
+        #--#--#
+        e-----#
+        #-----#
+        #######
+    """)[1:-1]
+    positions = dedent("""
+        #######
+        #--#--#
+        #^v#^v#
+        #--#-v#
+        e----v#
+        #-<<<-#
+        #######
+    """)[1:-1]
+    views = ViewCache(maxsize=4)
+
+    expected = Bot.simulate_all_moves(positions, master, views=views)
+    assert (views.hits, views.misses, len(views.views)) == (0, 9, 4)
+
+    assert Bot.simulate_all_moves(positions, master, views=views) == expected
+    assert views.hits == 0
+
+    views.precompute(master)
+    assert Bot.simulate_all_moves(positions, master, views=views) == expected
+    assert views.hits == 9
+
+
+@pytest.mark.parametrize('orientation', ['UP', 'RIGHT', 'DOWN', 'LEFT'])
+def test_view_cache_turns_upright_views(master, orientation):
+    views = ViewCache()
+    board = master.rotated(orientation)
+
+    for cell in board.filter('-'):
+        assert views.get(str(master), orientation, cell) == Bot.simulate_each_move(board, cell)
+    assert len(views.views) == len(list(master.filter('-')))
+
+
+# canonical_view
+# ============================================================================
+@pytest.mark.parametrize('view', ['#--\n#b-\n#--', '##e\n-b-\n---', 'o#o\n-b-\no#o'])
+def test_canonical_view_is_shared_by_rotations(view):
+    canonical, _ = canonical_view(view.replace('\n', '').encode())
+
+    for direction in ('UP', 'RIGHT', 'DOWN', 'LEFT'):
+        rotated = Board.rotate(view, direction)
+        key, turn = canonical_view(rotated.replace('\n', '').encode())
+
+        assert key == canonical
+        assert Board.rotate(rotated, ('UP', 'RIGHT', 'DOWN', 'LEFT')[turn]).replace('\n', '') == key.decode()
+
+
 # Bot.simulate_all_moves
 # ============================================================================
 def test_bot_reveal_map():
@@ -873,6 +1175,7 @@ def test_bot_reveal_map():
     bot = Bot(board)
 
     assert bot.reveal_map(moves, master) == ['RIGHT', 'UP', 'DOWN']
+    assert bot.reveal_map(moves, master, distances=distance_field(Board.from_str(master))) == ['RIGHT', 'UP', 'DOWN']
 
 
 # Cartesian.init
@@ -900,6 +1203,11 @@ def test_cartesian_hash_includes_y_and_x():
     assert hash(cartesian) == hash((2, 2))
 
 
+@pytest.mark.parametrize('cartesian', [Cartesian(1, 2), Coord(1, 2), Cell(1, 2, '-'), Delta(1, 2), Dimensions(1, 2)])
+def test_cartesian_uses_slots(cartesian):
+    assert not hasattr(cartesian, '__dict__')
+
+
 # Coord.to_cell
 # ============================================================================
 def test_coord_to_cell():
@@ -1026,3 +1334,211 @@ def test_bot_next_move_2():
     bot = Bot(board)
 
     assert bot.next_move(master) == 'RIGHT'
+
+
+def test_session_turns(master, tmpdir):
+    session = Session(str(master), store=MazeStore(str(master), directory=str(tmpdir)))
+
+    assert session.turn('1\n#--\n#--\n#--') == 'RIGHT'
+    assert session.turn('1\n###\n---\n---') == 'LEFT'
+    assert str(session.board) == dedent("""
+        ###
+        -b-
+        ---
+        ###
+    """)[1:-1]
+    assert session.move == 'LEFT'
+
+
+def test_session_plays_opening_book_moves(master, tmpdir):
+    book = OpeningBook(master)
+    book.add(Board.from_input('1\n#--\n#--\n#--'), 'UP')
+    session = Session(str(master), store=MazeStore(str(master), directory=str(tmpdir)), book=book)
+
+    assert session.turn('1\n#--\n#--\n#--') == 'UP'
+    assert session.turn('1\n#--\n#--\n#--') == 'RIGHT'
+
+
+def test_serve(master, tmpdir):
+    requests = [
+        {'game': 1, 'input': '1\n#--\n#--\n#--', 'master': str(master)},
+        {'game': 2, 'input': '1\n#--\n#--'},
+        {'game': 1, 'input': '1\n###\n---\n---'},
+        {'game': 1, 'end': True},
+    ]
+    stdout = StringIO()
+
+    with tmpdir.as_cwd():
+        serve(StringIO(''.join(json.dumps(request) + '\n' for request in requests)), stdout)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert responses[0] == {'game': 1, 'move': 'RIGHT'}
+    assert 'has no session' in responses[1]['error']
+    assert responses[2:] == [{'game': 1, 'move': 'LEFT'}, {'game': 1}]
+
+
+def test_serve_errors_on_dropped_games(master, tmpdir, monkeypatch):
+    monkeypatch.setattr(main, 'MAX_SESSIONS', 1)
+    requests = [
+        {'game': 1, 'input': '1\n#--\n#--\n#--', 'master': str(master)},
+        {'game': 2, 'input': '1\n#--\n#--\n#--', 'master': str(master)},
+        {'game': 1, 'input': '1\n###\n---\n---'},
+    ]
+    stdout = StringIO()
+
+    with tmpdir.as_cwd():
+        serve(StringIO(''.join(json.dumps(request) + '\n' for request in requests)), stdout)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert responses[:2] == [{'game': 1, 'move': 'RIGHT'}, {'game': 2, 'move': 'RIGHT'}]
+    assert 'Game 1 has no session' in responses[2]['error']
+
+
+def test_serve_answers_malformed_requests(master, tmpdir):
+    lines = ['', '{"game": 1, ', '[1]', json.dumps({'game': 1, 'input': '1\n#--\n#--\n#--', 'master': str(master)})]
+    stdout = StringIO()
+
+    with tmpdir.as_cwd():
+        serve(StringIO(''.join(line + '\n' for line in lines)), stdout)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [response['game'] for response in responses] == [None, None, None, 1]
+    assert all('error' in response for response in responses[:3])
+    assert responses[3] == {'game': 1, 'move': 'RIGHT'}
+
+
+# next_moves
+# ============================================================================
+def test_next_moves_keeps_order(master, tmpdir):
+    states = [
+        ('#--\n#b-\n#--', str(master)),
+        (Board.from_str('###\n-b-\n---\n###'), str(master)),
+        ('-#-\n-b-\n---', str(master)),
+        ('###\n#b-\n#--', str(master)),
+    ]
+    expected = [Bot(Board.from_str(str(board))).next_move(master_str) for board, master_str in states]
+
+    with tmpdir.as_cwd():
+        assert next_moves(states) == expected
+        assert next_moves(states * 3, processes=2) == expected * 3
+        assert next_moves(states, directory=str(tmpdir)) == expected
+
+    # only the directory it was given has maze stores
+    assert [path.basename for path in tmpdir.listdir()] == [os.path.basename(MazeStore(str(master)).filename)]
+
+
+@pytest.mark.parametrize('processes', [None, 1, 2])
+def test_next_moves_of_nothing(processes):
+    assert next_moves([], processes=processes) == []
+
+
+# State stores
+# ============================================================================
+@pytest.mark.parametrize('state_store', [
+    TextStateStore,
+    PackedStateStore,
+])
+def test_state_stores_resume_sessions(master, tmpdir, state_store):
+    inputs = ['1\n#--\n#--\n#--', '1\n###\n---\n---', '1\n###\n--#\n--#']
+    store = MazeStore(str(master), directory=str(tmpdir))
+    session = Session(str(master), store=store)
+    expected = [session.turn(data) for data in inputs]
+
+    moves = []
+    for data in inputs:
+        resumed = Session(str(master), store=store)
+        state = state_store(str(tmpdir))
+        state.load(resumed)
+        moves.append(resumed.turn(data))
+        state.dump(resumed)
+
+    assert moves == expected
+    assert resumed.belief.hypotheses == session.belief.hypotheses
+
+
+def test_packed_state_store_round_trip(master, tmpdir):
+    session = Session(str(master), store=MazeStore(str(master), directory=str(tmpdir)))
+    session.turn('1\n#--\n#--\n#--')
+    state = PackedStateStore(str(tmpdir))
+
+    state.dump(session)
+    loaded = Session(str(master), store=session.store)
+    state.load(loaded)
+
+    assert str(loaded.board) == str(session.board)
+    assert loaded.board.find('b') == session.board.find('b')
+    assert loaded.move == session.move == 'RIGHT'
+    assert loaded.belief.hypotheses == session.belief.hypotheses
+    assert not tmpdir.listdir(lambda path: path.ext == '.tmp')
+
+    # stored for another master, the belief is rebuilt from the map
+    other = Session('#####\n#---e\n#####', store=MazeStore('#####\n#---e\n#####', directory=str(tmpdir)))
+    state.load(other)
+    assert str(other.board) == str(session.board)
+    assert other.belief is None
+
+
+# Stats
+# ============================================================================
+def test_stats_times_phases_and_counts():
+    stats = Stats(enabled=True)
+
+    with stats.phase('outer'):
+        with stats.phase('inner'):
+            stats.count('boards_forked', 2)
+    with stats.phase('inner'):
+        stats.count('boards_forked')
+
+    report = stats.report()
+    assert {name: phase['calls'] for name, phase in report['phases'].items()} == {'outer': 1, 'inner': 2}
+    assert report['counters'] == {'boards_forked': 3}
+    assert stats.report() == {'phases': {}, 'counters': {}}
+
+
+def test_stats_disabled_records_nothing():
+    stats = Stats()
+
+    with stats.phase('outer'):
+        stats.count('boards_forked')
+
+    assert stats.report() == {'phases': {}, 'counters': {}}
+
+
+def test_session_turn_reports_stats(master, tmpdir, monkeypatch):
+    monkeypatch.setattr(STATS, 'enabled', True)
+    STATS.report()
+    session = Session(str(master), store=MazeStore(str(master), directory=str(tmpdir)), book=OpeningBook(master))
+
+    session.turn('1\n#--\n#--\n#--')
+    report = STATS.report()
+
+    assert set(report['phases']) == {'turn', 'observe', 'decide', 'search', 'find_path', 'find_position',
+                                      'simulate_all_moves', 'reveal_map'}
+    assert report['counters']['book_misses'] == 1
+    assert report['counters']['boards_forked'] > 0
+    assert report['counters']['cells_scanned'] > 0
+    assert report['counters'].get('view_cache_hits', 0) + report['counters'].get('view_cache_misses', 0) > 0
+
+    f = StringIO()
+    session.turn('1\n###\n---\n---')
+    STATS.dump(f)
+    assert json.loads(f.getvalue())['stats']['phases']['turn']['calls'] == 1
+
+
+# OpeningBook
+# ============================================================================
+def test_opening_book_dump_and_load(master, board1):
+    book = OpeningBook(master)
+    book.add(board1, 'LEFT')
+    f = BytesIO()
+
+    book.dump(f)
+    f.seek(0)
+    loaded = OpeningBook.load(f, master)
+
+    assert len(loaded) == 1
+    assert loaded.get(board1) == 'LEFT'
+    assert loaded.get(board1.rotated('RIGHT')) is None
+
+    f.seek(0)
+    assert OpeningBook.load(f, board1) is None
@@ -0,0 +1,200 @@
+# coding=utf-8
+import os
+import random
+import sys
+from textwrap import dedent
+
+import pytest
+
+from .generate import generate
+from .run import BOOK_NAME, LOST, Board, GameWon, InvalidTarget, Worker, play, temp_dir
+
+# a stand in for main.py --worker, that hangs, dies or answers out of step when its input asks it to
+FAKE_BOT = dedent("""
+    import json
+    import sys
+    import time
+
+    ended = set()
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        if request.get('end'):
+            ended.add(request['game'])
+            sys.stdout.write(json.dumps({'game': request['game']}) + '\\n')
+            sys.stdout.flush()
+            continue
+
+        if 'hang' in request['input']:
+            time.sleep(60)
+        if 'crash' in request['input']:
+            sys.exit(1)
+        if 'chatty' in request['input']:
+            sys.stdout.write('thinking...\\n')
+        if 'lost' in request['input']:
+            request['game'] += 1
+
+        move = 'ENDED' if request['game'] in ended else 'MASTER' if 'master' in request else 'UP'
+        sys.stdout.write(json.dumps({'game': request['game'], 'move': move}) + '\\n')
+        sys.stdout.flush()
+""")
+
+
+class RotatingBoard(object):
+    """The engine run.Board replaced, rotating the whole maze on every move, to check it against"""
+
+    def __init__(self, state):
+        self.state = [list(row) for row in state.split('\n') if row]
+
+    def find(self, target='b'):
+        for y, row in enumerate(self.state):
+            for x, char in enumerate(row):
+                if char == target:
+                    return y, x
+        raise InvalidTarget()
+
+    def set(self, y, x, value):
+        target = self.state[y][x]
+        if target == '#':
+            raise InvalidTarget('Cannot cross #')
+        self.state[y][x] = value
+        if target == 'e':
+            raise GameWon()
+
+    def move(self, direction):
+        self.state = [list(row) for row in Board.rotate(str(self), direction).split('\n')]
+        pos_y, pos_x = self.find()
+        self.set(pos_y, pos_x, '-')
+        self.set(pos_y - 1, pos_x, 'b')
+
+    def view(self):
+        pos_y, pos_x = self.find()
+        cells = [self.state[pos_y + y][pos_x + x] for y in (-1, 0, 1) for x in (-1, 0, 1)]
+        cells[4] = '-'
+        return '\n'.join(''.join(cells[start:start + 3]) for start in (0, 3, 6))
+
+    def __str__(self):
+        return Board.to_string(self.state)
+
+
+def outcome(call):
+    """A call's result, or the type of what it raised"""
+
+    try:
+        return call()
+    except (GameWon, InvalidTarget, IndexError) as e:
+        return type(e)
+
+
+# FIXTURES
+# ============================================================================
+@pytest.fixture
+def worker(tmpdir):
+    bot = tmpdir.join('bot.py')
+    bot.write(FAKE_BOT)
+
+    worker = Worker((sys.executable, str(bot)), timeout=1.0)
+    yield worker
+    worker.close()
+
+
+# temp_dir
+# ============================================================================
+def test_temp_dir_copies_the_book_by_the_name_the_bot_reads(tmpdir):
+    book = tmpdir.join('custom.bin')
+    book.write_binary(b'book')
+
+    with temp_dir(book=str(book)) as path:
+        assert os.listdir(path()) == [BOOK_NAME]
+        assert open(path(BOOK_NAME), 'rb').read() == b'book'
+
+    with temp_dir(book=str(tmpdir.join('missing.bin'))) as path:
+        assert os.listdir(path()) == []
+
+
+# Worker
+# ============================================================================
+def test_worker_plays_games(worker):
+    next_move = worker.bot('master')
+
+    assert next_move('1\n---') == ('MASTER', '')
+    assert next_move('1\n---') == ('UP', '')
+    assert worker.generation == 1
+
+
+@pytest.mark.parametrize('view, error', [
+    ('hang', 'Worker timed out after 1.0s'),
+    ('crash', 'Worker crashed'),
+    ('chatty', "Worker sent 'thinking...'"),
+    ('lost', 'Worker sent \'{"game": 2, "move": "UP"}\''),
+])
+def test_worker_restarts_after_a_failed_move(worker, view, error):
+    next_move = worker.bot('master')
+    assert next_move('1\n---') == ('MASTER', '')
+
+    assert next_move(view) == ('', error)
+    assert worker.handle is None
+
+    # a fresh worker, told the master again
+    assert next_move('1\n---') == ('MASTER', '')
+    assert worker.generation == 2
+
+
+def test_worker_ends_games(worker):
+    next_move, other = worker.bot('master'), worker.bot('master')
+    next_move('1\n---')
+    other('1\n---')
+
+    next_move.end()
+    assert next_move('1\n---') == ('ENDED', '')
+    assert other('1\n---') == ('UP', '')
+    assert worker.generation == 1
+
+
+def test_worker_skips_ending_games_it_lost(worker):
+    next_move = worker.bot('master')
+    next_move('1\n---')
+    next_move('crash')
+
+    next_move.end()
+    assert worker.handle is None
+
+
+# play
+# ============================================================================
+def test_play_ends_the_game(worker):
+    next_move = worker.bot('master')
+
+    moves, outcome, _ = play(Board('###\n#b#\n#-#'), next_move)
+    assert (len(moves), outcome) == (1, LOST)
+    assert next_move('1\n---') == ('ENDED', '')
+
+
+# Board
+# ============================================================================
+@pytest.mark.parametrize('algorithm', ['backtracker', 'rooms'])
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('facing', ['UP', 'RIGHT', 'DOWN', 'LEFT'])
+def test_board_plays_like_rotating_the_maze(algorithm, seed, facing):
+    maze = generate(9, 13, algorithm, seed)
+    cells = [index for index, char in enumerate(maze) if char == '-']
+    rng = random.Random(seed)
+
+    for start in rng.sample(cells, 10):
+        state = maze[:start] + 'b' + maze[start + 1:]
+        board, expected = Board(state, facing), RotatingBoard(Board.rotate(state, facing))
+
+        for _ in range(60):
+            assert str(board) == str(expected)
+            assert outcome(board.find) == outcome(expected.find)
+            assert outcome(board.view) == outcome(expected.view)
+
+            direction = rng.choice(['UP', 'RIGHT', 'DOWN', 'LEFT', 'UP', 'UP'])
+            result = outcome(lambda: board.move(direction))
+            assert result == outcome(lambda: expected.move(direction))
+            if result:
+                break
+
+        # the board left behind once the game is over
+        assert str(board) == str(expected)
+        assert outcome(board.find) == outcome(expected.find)
+        assert outcome(board.view) == outcome(expected.view)
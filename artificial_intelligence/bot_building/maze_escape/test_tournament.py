@@ -0,0 +1,105 @@
+# coding=utf-8
+from textwrap import dedent
+
+import pytest
+
+from . import run
+from .main import Board, OpeningBook
+from .tournament import starts, percentile, summarize, play_games
+
+MAZE = dedent("""
+    #####
+    #--##
+    #-#-e
+    #####
+""")[1:-1]
+
+
+def result(outcome, moves, latencies=()):
+    return {'outcome': outcome, 'moves': moves, 'latencies': list(latencies)}
+
+
+# starts
+# ============================================================================
+def test_starts_every_open_cell_and_facing():
+    games = starts(MAZE)
+
+    assert len(games) == 4 * 4
+    assert {(y, x) for y, x, _ in games} == {(1, 1), (1, 2), (2, 1), (2, 3)}
+    assert {facing for _, _, facing in games} == {'UP', 'RIGHT', 'DOWN', 'LEFT'}
+
+
+def test_starts_samples_by_seed():
+    assert len(starts(MAZE, limit=5)) == 5
+    assert starts(MAZE, limit=5, seed=1) == starts(MAZE, limit=5, seed=1)
+    assert set(starts(MAZE, limit=5, seed=1)) <= set(starts(MAZE))
+    assert starts(MAZE, limit=100) == starts(MAZE)
+
+
+# percentile
+# ============================================================================
+@pytest.mark.parametrize('values, q, expected', [
+    (range(1, 11), 0, 1),
+    (range(1, 11), 10, 1),
+    (range(1, 11), 50, 5),
+    (range(1, 11), 90, 9),
+    (range(1, 11), 99, 10),
+    (range(1, 11), 100, 10),
+    (range(1, 6), 50, 3),
+    (range(1, 6), 90, 5),
+    (range(1, 4), 50, 2),
+    (range(1, 4), 99, 3),
+    ([7], 1, 7),
+])
+def test_percentile_nearest_rank(values, q, expected):
+    assert percentile(list(values), q) == expected
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 50) is None
+
+
+# summarize
+# ============================================================================
+def test_summarize():
+    summary = summarize([
+        result(run.WON, 4, [0.001, 0.003]),
+        result(run.WON, 10, [0.002]),
+        result(run.LOST, 1, [0.004]),
+        result(run.UNFINISHED, 50),
+    ])
+
+    assert (summary['games'], summary['won'], summary['lost'], summary['unfinished']) == (4, 2, 1, 1)
+    assert summary['moves'] == {'mean': 7, 'median': 7, 'max': 10}
+    assert summary['latency_ms'] == pytest.approx({'p50': 2, 'p90': 4, 'p99': 4, 'max': 4})
+
+
+def test_summarize_nothing_won():
+    summary = summarize([result(run.LOST, 1)])
+
+    assert summary['moves'] == {'mean': None, 'median': None, 'max': None}
+    assert summary['latency_ms'] == {'p50': None, 'p90': None, 'p99': None, 'max': None}
+
+
+# play_games
+# ============================================================================
+def test_play_games_needs_a_session_to_play_in_process(tmpdir):
+    target = tmpdir.join('bot.py')
+    target.write('print("UP")\n')
+
+    with pytest.raises(ValueError):
+        play_games([('maze', MAZE, 1, 1, 'UP')], target=str(target), book=str(tmpdir.join('book.bin')))
+
+
+@pytest.mark.parametrize('name', ['book.bin', 'custom.bin'])
+def test_play_games_reads_a_book_by_any_name(tmpdir, name):
+    # the bot wins from here, unless the book sends it into the wall ahead
+    start = run.Board(MAZE[:15] + 'b' + MAZE[16:], 'UP')
+    book = OpeningBook(Board.from_str(MAZE))
+    book.add(Board.from_input('1\n%s' % start.view()), 'UP')
+    with open(str(tmpdir.join(name)), 'wb') as f:
+        book.dump(f)
+
+    games = [('maze', MAZE, 2, 3, 'UP')]
+    assert play_games(games)[0]['outcome'] == run.WON
+    assert play_games(games, book=str(tmpdir.join(name)))[0]['outcome'] == run.LOST
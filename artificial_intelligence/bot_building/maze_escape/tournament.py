@@ -0,0 +1,213 @@
+# /usr/bin/env python
+# coding=utf-8
+from __future__ import print_function
+
+import json
+import math
+import os.path
+import random
+import sys
+from argparse import ArgumentParser, FileType
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from functools import partial, wraps
+from statistics import mean, median
+from time import perf_counter
+
+try:
+    from . import run
+except ImportError:  # run as a script
+    import run
+
+BASE_PATH = partial(os.path.join, os.path.abspath(os.path.dirname(__file__)))
+
+# DEFAULTS
+TARGET = BASE_PATH('main.py')
+MAZES = BASE_PATH('mazes')
+JOBS = os.cpu_count() or 1
+GAMES = 0
+SEED = 0
+ENGINE = 'process'
+
+FACINGS = ('UP', 'RIGHT', 'DOWN', 'LEFT')
+
+
+def load_mazes(path):
+    """Read every maze file in a directory, as (name, maze) pairs"""
+
+    for filename in sorted(os.listdir(path)):
+        with open(os.path.join(path, filename)) as f:
+            maze = f.read().strip().replace('b', '-')
+
+        if maze:
+            yield filename, maze
+
+
+def starts(maze, limit=GAMES, seed=SEED):
+    """Start positions and facings for a maze, all of them or a seeded sample of limit"""
+
+    rows = maze.split('\n')
+    games = [(y, x, facing)
+             for y, row in enumerate(rows) for x, char in enumerate(row) if char == '-'
+             for facing in FACINGS]
+
+    if limit and limit < len(games):
+        games = random.Random(seed).sample(games, limit)
+
+    return games
+
+
+def timed(next_move, latencies):
+    """Wrap a next move callable, recording seconds spent per move"""
+
+    @wraps(next_move)
+    def wrapper(stdin):
+        start = perf_counter()
+        try:
+            return next_move(stdin)
+        finally:
+            latencies.append(perf_counter() - start)
+
+    return wrapper
+
+
+def play_games(games, target=TARGET, engine=ENGINE, max_moves=run.MAX_MOVES, timeout=run.TIMEOUT,
+               book=run.BOOK):
+    """Play a shard of games, each (name, maze, y, x, facing), in this process"""
+
+    results = []
+
+    with run.temp_dir(book=book):
+        bot = run.load_bot(target) if engine == 'process' else None
+        if engine == 'process' and not bot:
+            raise ValueError('%s has no Session to run in process' % target)
+        worker = run.Worker((run.EXECUTABLE, target), timeout=timeout) if engine == 'worker' else None
+
+        for name, maze, y, x, facing in games:
+            rows = [list(row) for row in maze.split('\n')]
+            rows[y][x] = 'b'
+
+            board = run.Board(run.Board.to_string(rows), facing)
+
+            latencies = []
+            next_move = worker.bot(maze) if worker else run.in_process_bot(bot, maze)
+            moves, outcome, message = run.play(board, timed(next_move, latencies), max_moves)
+
+            results.append({
+                'maze': name,
+                'start': [y, x],
+                'facing': facing,
+                'outcome': outcome,
+                'moves': len(moves),
+                'message': message,
+                'latencies': latencies,
+            })
+
+        if worker:
+            worker.close()
+
+    return results
+
+
+def percentile(values, q):
+    """Nearest rank percentile of sorted values"""
+
+    if not values:
+        return None
+
+    rank = max(math.ceil(q / 100.0 * len(values)), 1) - 1
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(results):
+    """Aggregate game results"""
+
+    won = [result['moves'] for result in results if result['outcome'] == run.WON]
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+
+    return {
+        'games': len(results),
+        'won': len(won),
+        'lost': sum(1 for result in results if result['outcome'] == run.LOST),
+        'unfinished': sum(1 for result in results if result['outcome'] == run.UNFINISHED),
+        'moves': {
+            'mean': mean(won) if won else None,
+            'median': median(won) if won else None,
+            'max': max(won) if won else None,
+        },
+        'latency_ms': {
+            key: None if value is None else value * 1000
+            for key, value in (
+                ('p50', percentile(latencies, 50)),
+                ('p90', percentile(latencies, 90)),
+                ('p99', percentile(latencies, 99)),
+                ('max', latencies[-1] if latencies else None),
+            )
+        },
+    }
+
+
+def tournament(mazes, target=TARGET, jobs=JOBS, limit=GAMES, seed=SEED, **kwargs):
+    """Play every start of every maze, sharded across processes"""
+
+    games = [(name, maze) + start for name, maze in mazes for start in starts(maze, limit, seed)]
+
+    # a few shards per process, so slow mazes don't leave cores idle
+    size = max(len(games) // (jobs * 4), 1)
+    shards = [games[index:index + size] for index in range(0, len(games), size)]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        play = partial(play_games, target=os.path.abspath(target), **kwargs)
+        return [result for results in executor.map(play, shards) for result in results]
+
+
+def create_parser():
+    """Create an argument parser"""
+
+    parser = ArgumentParser(description='Play maze escape across many mazes and starts.')
+    parser.add_argument('mazes', nargs='?', default=MAZES,
+                        help='Directory of maze files (%s)' % os.path.basename(MAZES))
+    parser.add_argument('-f', '--file', default=TARGET, dest='target',
+                        help='Bot to play (%s)' % os.path.basename(TARGET))
+    parser.add_argument('-j', '--jobs', default=JOBS, type=int,
+                        help='Processes to play in (%d)' % JOBS)
+    parser.add_argument('-n', '--games', default=GAMES, type=int, dest='limit',
+                        help='Starts to sample per maze, 0 for all of them (%d)' % GAMES)
+    parser.add_argument('-s', '--seed', default=SEED, type=int,
+                        help='Seed for sampling starts (%d)' % SEED)
+    parser.add_argument('-m', '--max', default=run.MAX_MOVES, type=int, dest='max_moves',
+                        help='Max number of moves (%d)' % run.MAX_MOVES)
+    parser.add_argument('-b', '--book', default=run.BOOK,
+                        help='Opening book to give the bot, when it exists (%s)' % os.path.basename(run.BOOK))
+    parser.add_argument('--engine', default=ENGINE, choices=('process', 'worker'),
+                        help='Play the bot in process or through a worker process (%s)' % ENGINE)
+    parser.add_argument('-o', '--out', type=FileType('w'), dest='results',
+                        help='File to dump every game result to')
+
+    return parser.parse_args()
+
+
+def main():
+    args = create_parser()
+
+    # before starting any process, as run.py does
+    if args.engine == 'process' and not run.load_bot(args.target):
+        sys.exit('%s has no Session to run in process' % args.target)
+
+    results = tournament(load_mazes(args.mazes), target=args.target, jobs=args.jobs, limit=args.limit,
+                         seed=args.seed, engine=args.engine, max_moves=args.max_moves, book=args.book)
+    summary = summarize(results)
+
+    print(json.dumps(summary, sort_keys=True, indent=2))
+
+    if args.results:
+        with closing(args.results) as f:
+            json.dump({'summary': summary, 'results': results}, f, sort_keys=True, indent=2)
+
+    # fail the run when any game was not won
+    if summary['won'] != summary['games']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()